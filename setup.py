@@ -73,7 +73,9 @@ class LinuxGogamesDistribution(Distribution):
     def __init__(self, *args):
         Distribution.__init__(self, *args)
         self.scripts = ["usr/bin/gogames-screensaver", 
-                        "usr/bin/gogames-sgf-thumbnailer"]
+                        "usr/bin/gogames-sgf-thumbnailer",
+                        "usr/bin/gogames-batch-render",
+                        "usr/bin/gogames-export-frames"]
 
 class WindowsGogamesDistribution(Distribution):
     def __init__(self, *args):
@@ -135,8 +137,7 @@ setup(name="gogames-screensaver",
                      glob.glob("etc/xdg/gogames-screensaver/*.xml")),
                     ("usr/share/man/man1",
                      glob.glob("usr/share/man/man1/*.gz"))],
-      requires = ["cairo", "gio", "glib", "gtk", "pango", "rsvg", 
-                  "simpleparse"],
+      requires = ["cairo", "gio", "glib", "gtk", "pango", "rsvg"],
       distclass = my_distclass,
       cmdclass={'install': my_install,
                 'install_egg_info': my_egg_info_install})
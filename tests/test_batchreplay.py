@@ -0,0 +1,99 @@
+# Copyright (c) 2010 Julian Andrews.
+# All rights reserved.
+#
+# This file is part of Go Games Screensaver.
+#
+#    Go Games Screensaver is free software: you can redistribute it and/or 
+#    modify it under the terms of the GNU General Public License as 
+#    published by the Free Software Foundation, either version 3 of the 
+#    License, or (at your option) any later version.
+#
+#    Go Games Screensaver is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Go Games Screensaver.  If not, see 
+#    <http://www.gnu.org/licenses/>.
+
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "usr", "share", "gogames-screensaver", 
+    "gogames_screensaver"))
+
+import batchreplay
+import gogame
+
+def random_game(rand, size, count):
+    """Return the steps of a game of count random moves, on points empty at
+    the time, with a few passes and setup stones mixed in."""
+    goban = gogame.Goban(size=size)
+    steps = []
+    for i in range(count):
+        prop_id = 'BW'[i % 2]
+        if rand.random() < 0.03:
+            steps.append((prop_id, None))
+            continue
+        empty = [point for point, c in goban.iteritems() if c == 0]
+        point = rand.choice(empty)
+        if rand.random() < 0.03:
+            prop_id = 'A' + prop_id
+            goban.add_stone(gogame.color_mapping[prop_id[1]], point)
+        else:
+            goban.play_move(gogame.color_mapping[prop_id], point)
+        steps.append((prop_id, point))
+    return steps
+
+@unittest.skipIf(batchreplay.numpy is None, "numpy is not available")
+class ReplayTest(unittest.TestCase):
+
+    def test_capture(self):
+        steps = batchreplay.game_steps(
+                    "(;GM[1]SZ[9];B[ba];W[aa];B[ab])")
+        result = batchreplay.replay([steps], size=9)
+        self.assertEqual(result.boards[0, 0, 0], 0)
+        self.assertEqual(result.boards[0, 1, 0], 1)
+        self.assertEqual(result.boards[0, 0, 1], 1)
+        self.assertEqual(tuple(result.prisoners[0]), (0, 1))
+        self.assertEqual(result.moves[0], 3)
+        self.assertEqual(result.captures[0], 1)
+
+    def test_ko(self):
+        # White takes the ko at ec, then black retakes it at dc after a
+        # ko threat exchange elsewhere.
+        steps = batchreplay.game_steps(
+                    "(;GM[1]SZ[9];B[db];W[eb];B[cc];W[fc];B[dd];W[ed];"
+                    "B[ec];W[dc];B[aa];W[ii];B[ec])")
+        result = batchreplay.replay([steps], size=9)
+        board = result.boards[0]
+        self.assertEqual(board[4, 2], 1)
+        self.assertEqual(board[3, 2], 0)
+        self.assertEqual(tuple(result.prisoners[0]), (1, 1))
+        self.assertEqual(result.captures[0], 2)
+        self.assertEqual(batchreplay.cross_check([steps], size=9), [])
+
+    def test_empty(self):
+        result = batchreplay.replay([])
+        self.assertEqual(result.boards.shape, (0, 19, 19))
+        self.assertEqual(len(result.prisoners), 0)
+        result = batchreplay.replay([[], [('B', None)]], size=9)
+        self.assertEqual(result.boards.shape, (2, 9, 9))
+        self.assertFalse(result.boards.any())
+        self.assertEqual(list(result.moves), [0, 1])
+
+    def test_cross_check(self):
+        rand = random.Random(1)
+        for size, count in ((9, 150), (13, 250), (19, 300)):
+            games = [random_game(rand, size, count) for i in range(5)]
+            self.assertEqual(batchreplay.cross_check(games, size), [])
+            result = batchreplay.replay(games, size)
+            self.assertTrue(result.prisoners.sum() > 0)
+
+if __name__ == "__main__":
+    unittest.main()
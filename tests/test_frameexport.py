@@ -0,0 +1,108 @@
+# Copyright (c) 2010 Julian Andrews.
+# All rights reserved.
+#
+# This file is part of Go Games Screensaver.
+#
+#    Go Games Screensaver is free software: you can redistribute it and/or 
+#    modify it under the terms of the GNU General Public License as 
+#    published by the Free Software Foundation, either version 3 of the 
+#    License, or (at your option) any later version.
+#
+#    Go Games Screensaver is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Go Games Screensaver.  If not, see 
+#    <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "usr", "share", "gogames-screensaver", 
+    "gogames_screensaver"))
+
+try:
+    import cairo
+    import frameexport
+except ImportError:
+    cairo = None
+
+def read_chunks(filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    return frameexport._png_chunks(data)
+
+@unittest.skipIf(cairo is None, "pycairo is not available")
+class APNGWriterTest(unittest.TestCase):
+    size = 16
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, "game.png")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write_frames(self, first_alpha):
+        """Write a 3 frame animation, changing a different area in each frame
+        after the first, and return its chunks."""
+        surf = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.size, self.size)
+        cr = cairo.Context(surf)
+        cr.set_operator(cairo.OPERATOR_SOURCE)
+        cr.set_source_rgba(0.8, 0.6, 0.2, 1.0)
+        cr.paint()
+        # A translucent corner, away from the areas changed later.
+        cr.rectangle(0, 0, 2, 2)
+        cr.set_source_rgba(0.0, 0.0, 0.0, first_alpha)
+        cr.fill()
+        writer = frameexport.APNGWriter(self.filename, plays=2)
+        writer.add_frame(surf, (0, 0, self.size, self.size), 100)
+        for area in ((4, 4, 3, 2), (8, 9, 5, 4)):
+            cr.rectangle(*area)
+            cr.set_source_rgb(0.0, 0.0, 0.0)
+            cr.fill()
+            writer.add_frame(surf, area, 250)
+        writer.close()
+        return read_chunks(self.filename)
+
+    def check_animation(self, chunks):
+        types = [chunk_type for chunk_type, data in chunks]
+        self.assertEqual(types, ['IHDR', 'acTL', 'fcTL'] + 
+                         ['IDAT'] * types.count('IDAT') + 
+                         ['fcTL', 'fdAT'] * 2 + ['IEND'])
+        self.assertEqual(struct.unpack('>II', chunks[1][1]), (3, 2))
+        sequence = [struct.unpack('>I', data[:4])[0] for chunk_type, data in
+                    chunks if chunk_type in ('fcTL', 'fdAT')]
+        self.assertEqual(sequence, range(len(sequence)))
+        frames = [struct.unpack('>IIIIIHHBB', data)[1:5] for chunk_type, data
+                  in chunks if chunk_type == 'fcTL']
+        self.assertEqual(frames, [(self.size, self.size, 0, 0), (3, 2, 4, 4),
+                                  (5, 4, 8, 9)])
+
+    def test_round_trip(self):
+        self.check_animation(self.write_frames(1.0))
+
+    def test_frames_match_first_frame_format(self):
+        # The first frame isn't opaque, but the later ones are.
+        chunks = self.write_frames(0.5)
+        self.check_animation(chunks)
+        color_type = ord(chunks[0][1][9])
+        self.assertEqual(color_type, 6)
+        for chunk_type, data in chunks:
+            if chunk_type == 'fcTL':
+                width, height = struct.unpack('>II', data[4:12])
+            elif chunk_type == 'fdAT':
+                pixels = zlib.decompress(data[4:])
+                self.assertEqual(len(pixels), height * (1 + 4 * width))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# Copyright (c) 2010 Julian Andrews.
+# All rights reserved.
+#
+# This file is part of Go Games Screensaver.
+#
+#    Go Games Screensaver is free software: you can redistribute it and/or 
+#    modify it under the terms of the GNU General Public License as 
+#    published by the Free Software Foundation, either version 3 of the 
+#    License, or (at your option) any later version.
+#
+#    Go Games Screensaver is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Go Games Screensaver.  If not, see 
+#    <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "usr", "share", "gogames-screensaver", 
+    "gogames_screensaver"))
+
+import gamecache
+
+class GameCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = gamecache.GameCache(os.path.join(self.folder, "games"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_hit(self):
+        self.cache.store(("a.sgf", 1, 2), ["compiled"])
+        self.assertEqual(self.cache.load(("a.sgf", 1, 2)), ["compiled"])
+
+    def test_miss(self):
+        self.assertEqual(self.cache.load(("a.sgf", 1, 2)), None)
+        self.cache.store(("a.sgf", 1, 2), ["compiled"])
+        self.assertEqual(self.cache.load(("a.sgf", 1, 3)), None)
+
+    def test_corrupt_file(self):
+        key = ("a.sgf", 1, 2)
+        self.cache.store(key, ["compiled"])
+        filename = self.cache.filename(key)
+        for data in ("garbage", "", "(lp0\nI1\na.", "cos\nsystem\n."):
+            with open(filename, 'wb') as f:
+                f.write(data)
+            self.assertEqual(self.cache.load(key), None)
+            self.assertFalse(os.path.exists(filename))
+
+    def test_evicts_least_recently_used(self):
+        keys = [("%d.sgf" % i,) for i in range(4)]
+        for i, key in enumerate(keys):
+            self.cache.store(key, "x" * 1000)
+            os.utime(self.cache.filename(key), (i, i))
+        self.cache.max_size = 2 * os.path.getsize(self.cache.filename(keys[0]))
+        # Loading an entry makes it the most recently used.
+        self.assertEqual(self.cache.load(keys[0]), "x" * 1000)
+        self.cache.store(("4.sgf",), "x" * 1000)
+        remaining = [key for key in keys + [("4.sgf",)] if 
+                     os.path.exists(self.cache.filename(key))]
+        self.assertEqual(remaining, [keys[0], ("4.sgf",)])
+
+    def test_unwritable_folder(self):
+        with open(os.path.join(self.folder, "games"), 'w') as f:
+            f.write("not a folder")
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            self.cache.store(("a.sgf",), ["compiled"])
+        self.assertEqual(len(caught), 1)
+        self.assertEqual(self.cache.load(("a.sgf",)), None)
+
+if __name__ == "__main__":
+    unittest.main()
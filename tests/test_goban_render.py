@@ -0,0 +1,163 @@
+# Copyright (c) 2010 Julian Andrews.
+# All rights reserved.
+#
+# This file is part of Go Games Screensaver.
+#
+#    Go Games Screensaver is free software: you can redistribute it and/or 
+#    modify it under the terms of the GNU General Public License as 
+#    published by the Free Software Foundation, either version 3 of the 
+#    License, or (at your option) any later version.
+#
+#    Go Games Screensaver is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Go Games Screensaver.  If not, see 
+#    <http://www.gnu.org/licenses/>.
+
+
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+root_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_folder, "usr", "share", 
+                                "gogames-screensaver", "gogames_screensaver"))
+
+import gogame
+
+try:
+    import cairo
+    # Images are found relative to the root folder, as in the launchers.
+    os.chdir(root_folder)
+    import goban_render
+except ImportError:
+    cairo = None
+
+def sgf_point(point):
+    return ''.join(chr(ord('a') + x - 1) for x in point)
+
+def random_game(rand, size, count):
+    """Return an sgf game of count random moves on points empty at the time,
+    with markup on some of the nodes."""
+    goban = gogame.Goban(size=size)
+    nodes = []
+    color = 1
+    for i in range(count):
+        empty = [point for point, c in goban.iteritems() if c == 0]
+        point = rand.choice(empty)
+        goban.play_move(color, point)
+        node = ";%s[%s]" % ('B' if color == 1 else 'W', sgf_point(point))
+        if i % 7 == 3:
+            a, b = rand.sample(list(goban), 2)
+            node += "CR[%s]TR[%s]LN[%s:%s]" % (sgf_point(a), sgf_point(b), 
+                                              sgf_point(a), sgf_point(b))
+        nodes.append(node)
+        color = -color
+    return "(;GM[1]FF[4]SZ[%d]%s)" % (size, ''.join(nodes))
+
+def main_line(root):
+    nodes = [root]
+    while not nodes[-1].child_nodes == []:
+        nodes.append(nodes[-1][0])
+    return nodes
+
+def surface_data(surf):
+    surf.flush()
+    return str(surf.get_data())
+
+@unittest.skipIf(cairo is None, "pycairo or rsvg is not available")
+class GobanRendererTest(unittest.TestCase):
+    size = 200
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def full_draw(self, game_node, **kwargs):
+        renderer = goban_render.GobanRenderer(**kwargs)
+        renderer.game_node = game_node
+        renderer.board_size = game_node.goban.size
+        renderer.gen_board(self.size)
+        surf = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.size, self.size)
+        renderer.draw(cairo.Context(surf))
+        return surf
+
+    def test_damaged_areas_on_capture(self):
+        root = gogame.game_nodes_from_data(
+                   "(;GM[1]SZ[9];B[ba];W[aa];B[ab])")[0]
+        nodes = main_line(root)
+        renderer = goban_render.GobanRenderer()
+        renderer.game_node = nodes[2]
+        renderer.board_size = 9
+        renderer.gen_board(self.size)
+        cr = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 
+                                              self.size, self.size))
+        renderer.draw(cr)
+        renderer.game_node = nodes[3]
+        areas = renderer.damaged_areas()
+        # The captured stone, and the new stone and last move marker.
+        self.assertEqual(sorted(set(areas)), 
+                         sorted(renderer.point_area(point) for point in 
+                                ((1, 1), (1, 2))))
+        renderer.draw(cr)
+        self.assertEqual(renderer.damaged_areas(), [])
+
+    def test_damaged_areas_redraw_matches_full_draw(self):
+        rand = random.Random(1)
+        for size, kwargs in ((9, {}), (13, {'should_draw_territory': True})):
+            root = gogame.game_nodes_from_data(random_game(rand, size, 
+                                                           120))[0]
+            nodes = main_line(root)
+            renderer = goban_render.GobanRenderer(**kwargs)
+            renderer.game_node = root
+            renderer.board_size = size
+            renderer.gen_board(self.size)
+            surf = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.size, 
+                                      self.size)
+            cr = cairo.Context(surf)
+            renderer.draw(cr)
+            for game_node in nodes[1:]:
+                renderer.game_node = game_node
+                areas = renderer.damaged_areas()
+                cr.save()
+                if not areas is None:
+                    for area in areas:
+                        cr.rectangle(*area)
+                    cr.clip()
+                renderer.draw(cr)
+                cr.restore()
+                if game_node.depth % 20 == 0 or game_node is nodes[-1]:
+                    self.assertEqual(surface_data(surf), surface_data(
+                                     self.full_draw(game_node, **kwargs)))
+
+    def test_draw_to_file(self):
+        root = gogame.game_nodes_from_data(random_game(random.Random(2), 19,
+                                                       80))[0]
+        nodes = main_line(root)
+        for size in (self.size, 100):
+            renderer = goban_render.GobanRenderer()
+            for game_node in nodes[::10] + [nodes[-1]]:
+                renderer.game_node = game_node
+                filename = os.path.join(self.folder, "kept.png")
+                renderer.draw_to_file(size, filename)
+            fresh = goban_render.GobanRenderer()
+            fresh.game_node = nodes[-1]
+            reference = os.path.join(self.folder, "fresh.png")
+            fresh.draw_to_file(size, reference)
+            with open(filename, 'rb') as f:
+                data = f.read()
+            with open(reference, 'rb') as f:
+                self.assertEqual(data, f.read())
+            self.assertEqual(struct.unpack('>II', data[16:24]), (size, size))
+
+if __name__ == "__main__":
+    unittest.main()
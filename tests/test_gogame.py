@@ -0,0 +1,125 @@
+# Copyright (c) 2010 Julian Andrews.
+# All rights reserved.
+#
+# This file is part of Go Games Screensaver.
+#
+#    Go Games Screensaver is free software: you can redistribute it and/or 
+#    modify it under the terms of the GNU General Public License as 
+#    published by the Free Software Foundation, either version 3 of the 
+#    License, or (at your option) any later version.
+#
+#    Go Games Screensaver is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Go Games Screensaver.  If not, see 
+#    <http://www.gnu.org/licenses/>.
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "usr", "share", "gogames-screensaver", 
+    "gogames_screensaver"))
+
+import gogame
+
+def scratch_hash(goban):
+    """Return the Zobrist hash of goban computed from its stones."""
+    zobrist = goban.tables.zobrist
+    h = 0
+    for point, color in goban.iteritems():
+        h ^= zobrist[color][goban.tables.indices[point]]
+    return h
+
+def random_moves(rand, size, count):
+    """Return count (color, point) moves alternating black and white, on
+    points empty at the time, so there are plenty of captures."""
+    goban = gogame.Goban(size=size)
+    moves = []
+    color = 1
+    for i in range(count):
+        empty = [point for point, c in goban.iteritems() if c == 0]
+        point = rand.choice(empty)
+        goban.play_move(color, point)
+        moves.append((color, point))
+        color = -color
+    return moves
+
+def sgf_point(point):
+    return ''.join(chr(ord('a') + x - 1) for x in point)
+
+class HashTest(unittest.TestCase):
+
+    def test_hash_after_captures(self):
+        rand = random.Random(1)
+        goban = gogame.Goban(size=9)
+        captures = 0
+        for color, point in random_moves(rand, 9, 300):
+            prisoners = sum(goban.prisoners.values())
+            goban.play_move(color, point)
+            captures += sum(goban.prisoners.values()) > prisoners
+            self.assertEqual(goban.hash, scratch_hash(goban))
+        self.assertTrue(captures > 0)
+
+    def test_hash_after_kill_group(self):
+        rand = random.Random(2)
+        goban = gogame.Goban(size=9)
+        for color, point in random_moves(rand, 9, 60):
+            goban.play_move(color, point)
+        for point in list(goban):
+            if not goban[point] == 0:
+                goban.kill_group(gogame.Group(point, goban))
+                self.assertEqual(goban.hash, scratch_hash(goban))
+        self.assertEqual(goban.hash, 0)
+
+    def test_hash_unchanged_by_seeking(self):
+        rand = random.Random(3)
+        moves = random_moves(rand, 9, 200)
+        data = "(;GM[1]FF[4]SZ[9]%s)" % ''.join(
+                   ";%s[%s]" % ('B' if color == 1 else 'W', sgf_point(point))
+                   for color, point in moves)
+        root = gogame.game_nodes_from_data(data)[0]
+        nodes = [root]
+        while not nodes[-1].child_nodes == []:
+            nodes.append(nodes[-1][0])
+        expected = []
+        for node in nodes:
+            goban = node.goban
+            self.assertEqual(goban.hash, scratch_hash(goban))
+            expected.append(goban.hash)
+        for i in range(300):
+            n = rand.randrange(len(nodes))
+            goban = nodes[n].goban
+            self.assertEqual(goban.hash, expected[n])
+            self.assertEqual(goban.hash, scratch_hash(goban))
+            self.assertEqual(nodes[n].hash, expected[n])
+
+    def test_canonical_hash_symmetries(self):
+        rand = random.Random(4)
+        size = 9
+        transforms = (lambda x, y: (x, y), lambda x, y: (y, x),
+                      lambda x, y: (size + 1 - x, y),
+                      lambda x, y: (x, size + 1 - y),
+                      lambda x, y: (size + 1 - x, size + 1 - y),
+                      lambda x, y: (size + 1 - y, x),
+                      lambda x, y: (y, size + 1 - x),
+                      lambda x, y: (size + 1 - y, size + 1 - x))
+        for count in (1, 5, 40):
+            moves = random_moves(rand, size, count)
+            gobans = []
+            for transform in transforms:
+                goban = gogame.Goban(size=size)
+                for color, point in moves:
+                    goban.play_move(color, transform(*point))
+                gobans.append(goban)
+            hashes = set(goban.canonical_hash() for goban in gobans)
+            self.assertEqual(len(hashes), 1)
+            self.assertTrue(len(set(goban.hash for goban in gobans)) > 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+# Copyright (c) 2010 Julian Andrews.
+# All rights reserved.
+#
+# This file is part of Go Games Screensaver.
+#
+#    Go Games Screensaver is free software: you can redistribute it and/or 
+#    modify it under the terms of the GNU General Public License as 
+#    published by the Free Software Foundation, either version 3 of the 
+#    License, or (at your option) any later version.
+#
+#    Go Games Screensaver is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Go Games Screensaver.  If not, see 
+#    <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import unittest
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "usr", "share", "gogames-screensaver", 
+    "gogames_screensaver"))
+
+import sgfparse
+
+valid_data = [
+    "(;GM[1]FF[4]SZ[19];B[pd];W[dp];B[pp])",
+    "(;GM[1](;B[aa];W[bb])(;B[cc](;W[dd])(;W[ee])))",
+    "(;C[a \\] escaped bracket]N[back\\\\slash];B[aa]C[soft\\\nbreak])",
+    "(;AB[aa]  [bb]\n[cc]\t[dd]  ;  W[ee] ) ",
+    "(;GaMe[1]AddBlack[aa][bb]ab[cc];pLaYeR[B])",
+    "(;B[aa]B[bb]C[one]C[two];W[cc])",
+    "(;GM[1];B[aa])(;GM[1];W[bb])\n(;GM[1]SZ[9])",
+    "  \n(;C[]B[];W[tt])",
+]
+
+# Malformed data, with the trees the single pass parser recovers and the 
+# (position, resume position) of each error.
+malformed_data = [
+    ("(;B[aa];W[bb", 
+     [(';B[aa]', [('B', ['aa'])], [(';', [], [])])], [(8, 12), (12, 12)]),
+    ("(;B[aa]junk;W[bb])", 
+     [(';B[aa]', [('B', ['aa'])], [(';W[bb]', [('W', ['bb'])], [])])], 
+     [(7, 11)]),
+    ("(;B[aa])garbage(;W[cc])", 
+     [(';B[aa]', [('B', ['aa'])], []), (';W[cc]', [('W', ['cc'])], [])], 
+     [(8, 15)]),
+    ("(;C[a]b];B[aa])", 
+     [(';C[a]', [('C', ['a'])], [(';B[aa]', [('B', ['aa'])], [])])], 
+     [(6, 8)]),
+    ("(;GM[1](;B[aa])(;B[bb]);W[cc])", 
+     [(';GM[1]', [('GM', ['1'])], [(';B[aa]', [('B', ['aa'])], []), 
+                                   (';B[bb]', [('B', ['bb'])], [])])], 
+     [(23, 29)]),
+]
+
+def tree_tuple(node):
+    """Return a node and its descendants as nested (text, properties, 
+    children) tuples."""
+    return (str(node.text), sorted(node.items()), 
+            [tree_tuple(child) for child in node.child_nodes])
+
+def collection_tuples(collection):
+    return [tree_tuple(root) for root in collection]
+
+class ParseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.warnings = warnings.catch_warnings()
+        self.warnings.__enter__()
+        warnings.simplefilter("ignore")
+
+    def tearDown(self):
+        self.warnings.__exit__()
+
+    @unittest.skipIf(sgfparse.simpleparse is None, 
+                     "simpleparse is not available")
+    def test_grammar_parity(self):
+        for data in valid_data:
+            expected = collection_tuples(sgfparse.parse(data, 
+                                                        use_grammar=True))
+            self.assertEqual(collection_tuples(sgfparse.parse(data)), 
+                             expected, data)
+            self.assertEqual(collection_tuples(sgfparse.parse(data, 
+                                                              compact=True)),
+                             expected, data)
+
+    def test_valid_data_has_no_errors(self):
+        for data in valid_data:
+            self.assertEqual(sgfparse.parse(data).errors, [], data)
+
+    def test_duplicate_properties_keep_first(self):
+        root = sgfparse.parse("(;B[aa]B[bb]C[one]C[two])")[0]
+        self.assertEqual(root['B'], ['aa'])
+        self.assertEqual(root['C'], ['one'])
+
+    def test_recovery(self):
+        for data, trees, errors in malformed_data:
+            for compact in (False, True):
+                collection = sgfparse.parse(data, compact=compact)
+                self.assertEqual(collection_tuples(collection), trees, data)
+                self.assertEqual(collection.errors, errors, data)
+
+    @unittest.skipIf(sgfparse.simpleparse is None, 
+                     "simpleparse is not available")
+    def test_grammar_recovers_less(self):
+        # The grammar gives up on the rest of the data at the first error.
+        for data, trees, errors in malformed_data:
+            try:
+                collection = sgfparse.parse(data, use_grammar=True)
+            except sgfparse.SGFParseError:
+                continue
+            self.assertNotEqual(collection_tuples(collection), trees, data)
+
+    def test_unknown_prop_ids_kept_per_tree(self):
+        sgfparse.parse("(;B[aa])", compact=True)
+        shared = list(sgfparse._prop_names)
+        collection = sgfparse.parse("(;B[aa]XYZZY[1];Qq[2]W[bb])(;Qq[3])", 
+                                    compact=True)
+        self.assertEqual(sgfparse._prop_names, shared)
+        self.assertEqual(collection_tuples(collection), collection_tuples(
+            sgfparse.parse("(;B[aa]XYZZY[1];Qq[2]W[bb])(;Qq[3])")))
+        self.assertTrue(collection[0].tree.prop_names is not 
+                        collection[1].tree.prop_names)
+
+    def test_too_many_prop_ids(self):
+        ids = ["X%s" % ''.join(chr(ord('a') + int(d)) for d in str(i)) 
+               for i in range(20)]
+        data = "(;%s)" % ''.join("%s[1]" % prop_id for prop_id in ids)
+        max_prop_ids = sgfparse.Tree.max_prop_ids
+        sgfparse.Tree.max_prop_ids = len(sgfparse._prop_names) + 10
+        try:
+            self.assertRaises(sgfparse.SGFParseError, sgfparse.parse, data, 
+                              compact=True)
+        finally:
+            sgfparse.Tree.max_prop_ids = max_prop_ids
+
+    def test_unrecoverable(self):
+        self.assertRaises(sgfparse.SGFParseError, sgfparse.parse, "no sgf")
+        self.assertRaises(sgfparse.SGFParseError, sgfparse.parse, "")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2010 Julian Andrews.
+# All rights reserved.
+#
+# This file is part of Go Games Screensaver.
+#
+#    Go Games Screensaver is free software: you can redistribute it and/or 
+#    modify it under the terms of the GNU General Public License as 
+#    published by the Free Software Foundation, either version 3 of the 
+#    License, or (at your option) any later version.
+#
+#    Go Games Screensaver is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Go Games Screensaver.  If not, see 
+#    <http://www.gnu.org/licenses/>.
+
+import optparse
+import os
+import random
+import sys
+
+# Paths given on the command line are relative to where we started.
+start_folder = os.getcwd()
+root_folder = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+lib_folder = os.path.join(root_folder, "usr", "share", "gogames-screensaver")
+sys.path.insert(0, lib_folder)
+
+from gogames_screensaver import gogame
+from gogames_screensaver import perfstats
+from gogames_screensaver import sgfparse
+
+default_games_file = os.path.join(root_folder, "tools", "benchmark_games.sgf")
+
+def bench_load(games, rand):
+    """Build each game, then play through its main line."""
+    for data in games:
+        start = perfstats.clock()
+        root = gogame.game_nodes_from_data(data, main_line_only=True)[0]
+        middle = perfstats.clock()
+        moves = root.cursor.seek_move(-1).depth
+        end = perfstats.clock()
+        perfstats.record('load_%d' % moves, middle - start)
+        perfstats.record('play_%d' % moves, end - middle)
+
+def bench_replay(games, rand):
+    """Play the moves of each game's main line on a bare Goban, and on a 
+    copy of the board for every move, as GameNode did before the cursor."""
+    for data in games:
+        skipped_variations, nodes = gogame.compile_game(data)
+        size = int(nodes[0].get('SZ', [19])[0])
+        moves = [(gogame.color_mapping[prop_id], 
+                  gogame._point_from_string(node[prop_id][0])) for node in 
+                 nodes for prop_id in ('B', 'W') if 
+                 not node.get(prop_id) in (None, [''])]
+        start = perfstats.clock()
+        goban = gogame.Goban(size=size)
+        for color, point in moves:
+            goban.play_move(color, point)
+        middle = perfstats.clock()
+        goban = gogame.Goban(size=size)
+        for color, point in moves:
+            goban = gogame.Goban(goban)
+            goban.play_move(color, point)
+        end = perfstats.clock()
+        perfstats.record('replay_%d' % len(moves), middle - start)
+        perfstats.record('replay_copying_%d' % len(moves), end - middle)
+
+def bench_seek(games, rand, jumps=50):
+    """Jump to random positions on the main line of each game, after one 
+    pass through it, with checkpoints (seek_N) and by deltas alone 
+    (seek_deltas_N)."""
+    for data in games:
+        for stage, interval in (('seek', None), ('seek_deltas', sys.maxint)):
+            root = gogame.game_nodes_from_data(data, main_line_only=True)[0]
+            cursor = root.cursor
+            if not interval is None:
+                cursor.checkpoint_interval = interval
+            moves = cursor.seek_move(-1).depth
+            stage = '%s_%d' % (stage, moves)
+            for i in range(jumps):
+                n = rand.randrange(moves + 1)
+                start = perfstats.clock()
+                cursor.seek_move(n)
+                perfstats.record(stage, perfstats.clock() - start)
+
+benchmarks = [('load', bench_load), ('replay', bench_replay), 
+              ('seek', bench_seek)]
+
+def random_game(rand, size, moves):
+    """Return an sgf game of random moves, each on a point empty at the 
+    time, so there are plenty of captures."""
+    goban = gogame.Goban(size=size)
+    nodes = []
+    for i in range(moves):
+        empty = [point for point, color in goban.iteritems() if color == 0]
+        point = rand.choice(empty)
+        goban.play_move(1 if i % 2 == 0 else -1, point)
+        nodes.append(";%s[%s]" % ('BW'[i % 2], ''.join(chr(ord('a') + x - 1)
+                                                        for x in point)))
+    return "(;GM[1]FF[4]SZ[%d]%s)\n" % (size, ''.join(nodes))
+
+def generate(filename, seed):
+    """Write the benchmark games: ten 300 move games on 19x19, two 100 move 
+    games on 9x9 and a 3000 move game on 19x19."""
+    rand = random.Random(seed)
+    games = [random_game(rand, 19, 300) for i in range(10)]
+    games += [random_game(rand, 9, 100) for i in range(2)]
+    games.append(random_game(rand, 19, 3000))
+    with open(filename, 'w') as f:
+        f.write(''.join(games))
+
+def load_games(filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    return [data[start:stop] for start, stop in 
+            sgfparse.game_tree_offsets(data)]
+
+def report():
+    """Print a summary of each stage.  Stages are named after the benchmark
+    and the number of moves in the games timed."""
+    print "%-20s %6s %9s %9s %9s %9s" % ("stage", "count", "mean ms", 
+                                          "p50 ms", "p99 ms", "max ms")
+    for stage, h in sorted(perfstats.histograms.iteritems()):
+        print "%-20s %6d %9.3f %9.3f %9.3f %9.3f" % (stage, h.count, 
+                  1000 * h.mean(), 1000 * h.percentile(50), 
+                  1000 * h.percentile(99), 1000 * h.max)
+
+parser = optparse.OptionParser(usage="usage: %%prog [options] [benchmark]..."
+                               "\n\nTimes the benchmarks (%s) on a collection "
+                               "of games, by default\ntools/benchmark_games."
+                               "sgf, and prints a summary of the times." % 
+                               ", ".join(name for name, func in benchmarks))
+parser.add_option("-g", "--games", action="store", default=default_games_file,
+                  metavar="FILE", help="sgf collection to time")
+parser.add_option("-r", "--repeat", action="store", type="int", default=5, 
+                  metavar="N", help="number of times to run each benchmark")
+parser.add_option("--seed", action="store", type="int", default=1, 
+                  metavar="N", help="random seed")
+parser.add_option("--stats-file", dest="stats_file", default=None,
+                  metavar="FILE", help="write timing histograms to FILE")
+parser.add_option("--generate", action="store_true", default=False,
+                  help="write a new set of random games to the games file "
+                       "instead")
+
+def main():
+    options, args = parser.parse_args()
+    games_file = os.path.join(start_folder, options.games)
+    if options.generate:
+        generate(games_file, options.seed)
+        return
+    names = [name for name, func in benchmarks]
+    for name in args:
+        if not name in names:
+            parser.error("unknown benchmark: %s" % name)
+    games = load_games(games_file)
+    rand = random.Random(options.seed)
+    for name, func in benchmarks:
+        if args == [] or name in args:
+            for i in range(options.repeat):
+                func(games, rand)
+    report()
+    if not options.stats_file is None:
+        perfstats.dump(os.path.join(start_folder, options.stats_file))
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,8 @@ import gtk
 import pango
 import re
 
+import perfstats
+
 class AnnotationDisplay(gtk.VBox):
 
     prop_mapping = {'TE': "good move",
@@ -48,6 +50,7 @@ class AnnotationDisplay(gtk.VBox):
         super(AnnotationDisplay, self).__init__()
         self.game_info = {}
         self.annotations = {}
+        self.score_estimate = None
         self.labels = []
         self.font_desc = pango.FontDescription()
         self.font_desc.set_size(self.base_size * pango.SCALE)
@@ -161,6 +164,7 @@ class AnnotationDisplay(gtk.VBox):
         self.vbox.set_spacing(int(scale * self.game_info_spacing))
         self.set_hr_pixbuf()
         
+    @perfstats.timed('update_text_output')
     def update_text_output(self):
         self.update_game_info()
         self.update_annotations()
@@ -195,6 +199,9 @@ class AnnotationDisplay(gtk.VBox):
         if not self.annotations.get("V") == None:
             buff.insert_with_tags_by_name(my_iter, "Estimated score: %s" % 
                                           self.annotations["V"], "italic")
+        elif not self.score_estimate is None:
+            buff.insert_with_tags_by_name(my_iter, "Estimated score: %s\n" %
+                                    format_score(self.score_estimate), "italic")
         for prop, val in self.annotations.iteritems():
             if not self.prop_mapping.get(prop) == None:
                 text = (("very " if val == 2 else "") + self.prop_mapping[prop]
@@ -205,11 +212,16 @@ class AnnotationDisplay(gtk.VBox):
                 buff.insert(my_iter, "\n")
             buff.insert(my_iter, format_text(self.annotations["C"]))
 
+def format_score(score):
+    if score == 0:
+        return "even"
+    return "%s+%s" % ("B" if score > 0 else "W", abs(score))
+
 def format_text(text):
-    text = re.sub(r"[\t\v]", " ", text)
+    """Format a value for display.  Values from the game tree are 
+    sgfparse.Text, which are unescaped when converted to strings."""
+    text = re.sub(r"[\t\v]", " ", str(text))
     text = re.sub(r"\r\n|\n\r|\r|\n", "\n", text)
-    text = text.replace("\\\n", "")
-    text = re.sub(r"\\(.)", r'\1', text)
     return text
 
 def format_simpletext(text):
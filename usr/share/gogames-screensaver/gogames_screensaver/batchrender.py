@@ -0,0 +1,156 @@
+# Copyright (c) 2010 Julian Andrews.
+# All rights reserved.
+#
+# This file is part of Go Games Screensaver.
+#
+#    Go Games Screensaver is free software: you can redistribute it and/or 
+#    modify it under the terms of the GNU General Public License as 
+#    published by the Free Software Foundation, either version 3 of the 
+#    License, or (at your option) any later version.
+#
+#    Go Games Screensaver is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Go Games Screensaver.  If not, see 
+#    <http://www.gnu.org/licenses/>.
+
+import itertools
+import multiprocessing
+import os
+import time
+
+import goban_render
+import gogame
+
+# The renderer of each worker process, kept between games so that its stone
+# sprites and boards are reused.
+_renderer = None
+
+class BatchRenderResult(object):
+    """The number of games and images rendered by render_files, and the 
+    time taken in seconds.  errors holds a (filename, message) pair for 
+    each game which couldn't be read."""
+    def __init__(self, games, images, errors, seconds):
+        self.games = games
+        self.images = images
+        self.errors = errors
+        self.seconds = seconds
+
+    def images_per_second(self):
+        return self.images / self.seconds if self.seconds else 0.0
+
+def render_files(games, output_folder, moves, size=256, processes=None,
+                 should_draw_markup=True, progress=None):
+    """Draw the positions after each of moves in the main line of the first
+    game of each file to png files in output_folder.
+
+    games holds (filename, name) pairs, as returned by sgf_filenames.  The
+    images are named after the name and the move, so move 160 of a game 
+    named 2001/game is drawn to 2001/game-160.png in output_folder, with
+    the 2001 folder created if need be.  A move past the end of the game is
+    drawn as the final position.  Games are shared out between processes 
+    worker processes (by default one per cpu), which write their images 
+    straight to disk, so only a count comes back for each game.  progress,
+    if given, is called with each filename as its game is finished.
+
+    Nothing is drawn through gtk, so no display is needed.
+
+    """
+    moves = sorted(set(moves))
+    jobs = ((filename, name, moves, output_folder, size) for filename, name in
+            games)
+    start = time.time()
+    if processes == 1:
+        _init_worker(should_draw_markup)
+        pool = None
+        results = itertools.imap(_render_game, jobs)
+    else:
+        pool = multiprocessing.Pool(processes, _init_worker, 
+                                    (should_draw_markup, ))
+        results = pool.imap_unordered(_render_game, jobs)
+    games = images = 0
+    errors = []
+    try:
+        for filename, count, error in results:
+            games += 1
+            images += count
+            if not error is None:
+                errors.append((filename, error))
+            if not progress is None:
+                progress(filename)
+    finally:
+        if not pool is None:
+            pool.terminate()
+    return BatchRenderResult(games, images, errors, time.time() - start)
+
+def sgf_filenames(paths):
+    """Return (filename, name) pairs for the given sgf files, and the sgf 
+    files in any given folders.
+
+    A file's name is its path from the folder given, or just its file name
+    for a file given directly, without the extension.  Names are unique: a 
+    name which has already been used gets _2, _3, ... added.
+
+    """
+    used = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, subfolders, filenames in os.walk(path):
+                subfolders.sort()
+                for filename in sorted(filenames):
+                    if filename.lower().endswith('.sgf'):
+                        filename = os.path.join(folder, filename)
+                        yield filename, _unique_name(os.path.relpath(
+                                                     filename, path), used)
+        else:
+            yield path, _unique_name(os.path.basename(path), used)
+
+def _unique_name(filename, used):
+    name = base = os.path.splitext(filename)[0]
+    n = 1
+    while name in used:
+        n += 1
+        name = "%s_%d" % (base, n)
+    used.add(name)
+    return name
+
+def _init_worker(should_draw_markup):
+    global _renderer
+    _renderer = goban_render.GobanRenderer(should_draw_markup)
+
+def _render_game(job):
+    filename, name, moves, output_folder, size = job
+    count = 0
+    try:
+        folder = os.path.dirname(os.path.join(output_folder, name))
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                # Another worker may have just made it.
+                if not os.path.isdir(folder):
+                    raise
+        game_nodes = gogame.game_nodes_from_file(filename, main_line_only=True)
+        if game_nodes == []:
+            return filename, count, "No games found"
+        game_node = game_nodes[0]
+        move_num = 0
+        for move in moves:
+            while move_num < move and not game_node.child_nodes == []:
+                game_node = game_node[0]
+                move_num += 1
+            _renderer.game_node = game_node
+            _renderer.draw_to_file(size, os.path.join(output_folder, 
+                                                      "%s-%d.png" % (name, 
+                                                                     move)))
+            count += 1
+    except (IOError, OSError, gogame.GogameError), e:
+        return filename, count, str(e)
+    except Exception, e:
+        # Any other error in one game, such as a bad value found during 
+        # playback, mustn't stop the rest of the batch.
+        return filename, count, "%s: %s" % (type(e).__name__, e)
+    return filename, count, None
@@ -0,0 +1,264 @@
+# Copyright (c) 2010 Julian Andrews.
+# All rights reserved.
+#
+# This file is part of Go Games Screensaver.
+#
+#    Go Games Screensaver is free software: you can redistribute it and/or 
+#    modify it under the terms of the GNU General Public License as 
+#    published by the Free Software Foundation, either version 3 of the 
+#    License, or (at your option) any later version.
+#
+#    Go Games Screensaver is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Go Games Screensaver.  If not, see 
+#    <http://www.gnu.org/licenses/>.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import gogame
+
+_MOVE, _PASS, _SETUP = 1, 2, 3
+
+if not numpy is None:
+    _bits = numpy.arange(64, dtype=numpy.uint64)
+    _byte_counts = numpy.array([bin(i).count('1') for i in range(256)])
+
+class BatchReplayError(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return "Error Replaying Games - %s" % self.value
+
+class BatchResult(object):
+    """Final positions and statistics of a batch of replayed games.
+
+    boards[g, x - 1, y - 1] is the color at point (x, y) at the end of game
+    g.  prisoners[g] holds the number of black and white stones captured,
+    moves[g] the number of moves (including passes) and captures[g] the
+    number of moves which captured stones.
+
+    """
+    def __init__(self, boards, prisoners, moves, captures):
+        self.boards = boards
+        self.prisoners = prisoners
+        self.moves = moves
+        self.captures = captures
+
+def game_steps(data):
+    """Return the steps of the main line of the first game in data.
+
+    Each step is a (prop_id, point) pair: 'B' or 'W' for a move, with a point
+    of None for a pass, or 'AB', 'AW' or 'AE' for a setup stone.
+
+    """
+    skipped_variations, nodes = gogame.compile_game(data)
+    steps = []
+    for node in nodes:
+        for prop_id in ('B', 'W'):
+            if not node.get(prop_id) == None:
+                if node[prop_id][0] == '':
+                    steps.append((prop_id, None))
+                else:
+                    steps.append((prop_id,
+                                  gogame._point_from_string(node[prop_id][0])))
+        for prop_id in ('AB', 'AW', 'AE'):
+            if not node.get(prop_id) == None:
+                for point in gogame._points_from_pointlist(node[prop_id]):
+                    steps.append((prop_id, point))
+    return steps
+
+def replay(games, size=19):
+    """Replay a list of games, each a list of steps (see game_steps), at once.
+
+    The games are played on a stack of boards with the same rules as
+    gogame.Goban.play_move.  After each move, the chains next to the stone
+    are labeled by a flood fill run on all the boards at once, and chains
+    left without liberties are removed: first the opponent's, then the
+    player's own (suicide).
+
+    Each board is held as a bitboard per color, with the cells of a board
+    (including a border of off board cells) packed 64 to a word.
+
+    """
+    if numpy is None:
+        raise BatchReplayError("numpy is not available")
+    width = size + 2
+    kinds, colors, indices = _encode(games, size)
+    on_board_cells = numpy.zeros((width, width), bool)
+    on_board_cells[1:-1, 1:-1] = True
+    on_board_cells = on_board_cells.ravel()
+    on_board = _pack(on_board_cells[None])[0]
+    # planes[0] holds the black stones of each game, planes[1] the white.
+    planes = numpy.zeros((2, len(games), len(on_board)), numpy.uint64)
+    prisoners = numpy.zeros((len(games), 2), int)
+    moves = numpy.zeros(len(games), int)
+    captures = numpy.zeros(len(games), int)
+    offsets = numpy.array([-width, width, -1, 1])
+    for t in range(kinds.shape[1]):
+        kind = kinds[:, t]
+        moves += (kind == _MOVE) | (kind == _PASS)
+        games_now = numpy.flatnonzero((kind == _MOVE) | (kind == _SETUP))
+        if games_now.size == 0:
+            continue
+        color = colors[games_now, t]
+        index = indices[games_now, t]
+        word = index >> 6
+        bit = numpy.uint64(1) << (index & 63).astype(numpy.uint64)
+        planes[:, games_now, word] &= ~bit
+        stone = color != 0
+        planes[_plane(color[stone]), games_now[stone], word[stone]] |= \
+                                                                    bit[stone]
+        played = kind[games_now] == _MOVE
+        games_now, color, index = (games_now[played], color[played],
+                                   index[played])
+        # Only a move next to an opponent's stone can capture, and only one
+        # with no empty neighbors can be suicide.
+        neighbors = index[:, None] + offsets
+        black = _cells(planes[0], games_now[:, None], neighbors)
+        white = _cells(planes[1], games_now[:, None], neighbors)
+        enemy = numpy.where(color[:, None] == 1, white, black)
+        no_liberty = ~(on_board_cells[neighbors] & ~black & ~white).any(1)
+        check = enemy.any(1) | no_liberty
+        games_now, color, index, neighbors, enemy, no_liberty = (
+                games_now[check], color[check], index[check], 
+                neighbors[check], enemy[check], no_liberty[check])
+        if games_now.size == 0:
+            continue
+        empty = ~(planes[0, games_now] | planes[1, games_now]) & on_board
+        rows, slots = numpy.nonzero(enemy)
+        enemy_planes = planes[_plane(-color[rows]), games_now[rows]]
+        stones, liberties = _chains(enemy_planes, empty[rows], 
+                                    neighbors[rows, slots], width)
+        dead = liberties == 0
+        removed = numpy.zeros(empty.shape, numpy.uint64)
+        numpy.bitwise_or.at(removed, rows[dead], stones[dead])
+        captured = _popcount(removed)
+        planes[_plane(-color), games_now] &= ~removed
+        prisoners[games_now, _plane(-color)] += captured
+        captures[games_now[captured > 0]] += 1
+        # A move which captured stones next to it has a liberty.
+        suicide = no_liberty & (captured == 0)
+        if suicide.any():
+            games_now, color, index = (games_now[suicide], color[suicide], 
+                                       index[suicide])
+            stones, liberties = _chains(planes[_plane(color), games_now], 
+                                        empty[suicide], index, width)
+            dead = liberties == 0
+            rows = games_now[dead]
+            planes[_plane(color[dead]), rows] &= ~stones[dead]
+            prisoners[rows, _plane(color[dead])] += _popcount(stones[dead])
+    boards = (_unpack(planes[0], width * width).astype(numpy.int8) - 
+              _unpack(planes[1], width * width))
+    boards = boards.reshape(len(games), width, width)[:, 1:-1, 1:-1]
+    return BatchResult(boards, prisoners, moves, captures)
+
+def cross_check(games, size=19):
+    """Replay games with both replay and gogame.Goban, and return the indices
+    of any games where the results differ."""
+    result = replay(games, size)
+    mismatches = []
+    for g, steps in enumerate(games):
+        goban = gogame.Goban(size=size)
+        moves = 0
+        for prop_id, point in steps:
+            if prop_id in ('B', 'W'):
+                moves += 1
+                if not point is None:
+                    goban.play_move(gogame.color_mapping[prop_id], point)
+            else:
+                goban.add_stone(gogame.color_mapping[prop_id[1]], point)
+        board = numpy.zeros((size, size), numpy.int8)
+        for (x, y), color in goban.iteritems():
+            board[x - 1, y - 1] = color
+        if not (numpy.array_equal(board, result.boards[g]) and
+                tuple(result.prisoners[g]) == (goban.prisoners[1],
+                                               goban.prisoners[-1]) and
+                result.moves[g] == moves):
+            mismatches.append(g)
+    return mismatches
+
+def _encode(games, size):
+    """Return the kind, color and board index of each step as arrays of
+    shape (number of games, longest game)."""
+    width = size + 2
+    length = max([len(steps) for steps in games] + [0])
+    kinds = numpy.zeros((len(games), length), numpy.int8)
+    colors = numpy.zeros((len(games), length), numpy.int8)
+    indices = numpy.zeros((len(games), length), int)
+    for g, steps in enumerate(games):
+        for t, (prop_id, point) in enumerate(steps):
+            on_board = not point is None and 1 <= point[0] <= size and \
+                       1 <= point[1] <= size
+            if prop_id in ('B', 'W'):
+                kinds[g, t] = _MOVE if on_board else _PASS
+                colors[g, t] = gogame.color_mapping[prop_id]
+            elif on_board:
+                kinds[g, t] = _SETUP
+                colors[g, t] = gogame.color_mapping[prop_id[1]]
+            if on_board:
+                indices[g, t] = point[0] * width + point[1]
+    return kinds, colors, indices
+
+def _plane(color):
+    return (1 - color) // 2
+
+def _cells(plane, rows, indices):
+    """Return whether each of the cells at indices is set on the bitboards."""
+    shifts = (indices & 63).astype(numpy.uint64)
+    return (plane[rows, indices >> 6] >> shifts & numpy.uint64(1)).astype(bool)
+
+def _chains(same, empty, start, width):
+    """Label the chain through start on each bitboard of stones.
+
+    Returns the chain's stones, as a bitboard, and its number of liberties.
+    Boards have a border of off board cells, so shifting by one cell or one 
+    row never wraps onto the board.
+
+    """
+    stones = numpy.zeros(same.shape, numpy.uint64)
+    stones[numpy.arange(len(same)), start >> 6] = \
+                            numpy.uint64(1) << (start & 63).astype(numpy.uint64)
+    # Grow the chains until they stop changing, dropping each one from the
+    # working set as soon as it's complete.
+    active = numpy.arange(len(same))
+    chain = stones
+    while active.size:
+        grown = _dilate(chain, width) & same
+        changed = (grown != chain).any(1)
+        stones[active[~changed]] = grown[~changed]
+        active, chain, same = active[changed], grown[changed], same[changed]
+    return stones, _popcount(_dilate(stones, width) & empty)
+
+def _pack(cells):
+    words = -(-cells.shape[1] // 64)
+    padded = numpy.zeros((len(cells), words * 64), numpy.uint64)
+    padded[:, :cells.shape[1]] = cells
+    return numpy.bitwise_or.reduce(padded.reshape(len(cells), words, 64) <<
+                                   _bits, axis=2)
+
+def _unpack(packed, length):
+    cells = (packed[:, :, None] >> _bits) & numpy.uint64(1)
+    return cells.reshape(len(packed), packed.shape[1] * 64)[:, :length].astype(
+               bool)
+
+def _popcount(packed):
+    return _byte_counts[packed.view(numpy.uint8)].sum(1)
+
+def _dilate(cells, width):
+    grown = cells.copy()
+    for k in (1, width):
+        up = cells << numpy.uint64(k)
+        up[:, 1:] |= cells[:, :-1] >> numpy.uint64(64 - k)
+        down = cells >> numpy.uint64(k)
+        down[:, :-1] |= cells[:, 1:] << numpy.uint64(64 - k)
+        grown |= up
+        grown |= down
+    return grown
@@ -61,8 +61,8 @@ class Configuration(dict):
 
     filename = 'config.xml'
     xml_props = ('move_delay', 'start_delay', 'end_delay','markup', 
-                 'annotations', 'sgf_folder')
-    xml_prop_types = (int, int, int, int, int, str)
+                 'annotations', 'sgf_folder', 'territory', 'hud')
+    xml_prop_types = (int, int, int, int, int, str, int, int)
     xml_prop_dict = dict(zip(xml_props, xml_prop_types))
     
     def __init__(self):
@@ -127,6 +127,15 @@ class Configuration(dict):
                           help="disable annotations")
         parser.add_option("-k", dest="markup", action="store_const", const=0, 
                           default=self['markup'], help="disable markup")
+        parser.add_option("-t", dest="territory", action="store_const",
+                          const=1, default=self.get('territory', 0),
+                          help="show an estimate of territory")
+        parser.add_option("-p", dest="hud", action="store_const", const=1,
+                          default=self.get('hud', 0),
+                          help="show frame times and game load times")
+        parser.add_option("--stats-file", dest="stats_file", default=None,
+                          metavar="FILE", 
+                          help="write timing histograms to FILE on exit")
         parser.add_option("-f", dest="fullscreen", action="store_true",
                           default=False, help="fullscreen mode")
         parser.add_option("--dark", dest="dark", action="store_true",
@@ -219,6 +228,10 @@ class SSConfigWindow(gtk.Window):
         display_vbox.pack_start(self.markup_check)
         self.annotations_check = gtk.CheckButton("Display Annotations")
         display_vbox.pack_start(self.annotations_check)
+        self.territory_check = gtk.CheckButton("Display Territory Estimate")
+        display_vbox.pack_start(self.territory_check)
+        self.hud_check = gtk.CheckButton("Display Performance Statistics")
+        display_vbox.pack_start(self.hud_check)
         display_align.add(display_vbox)
         
         button_box = gtk.HButtonBox()
@@ -246,6 +259,8 @@ class SSConfigWindow(gtk.Window):
             self.source_checkbuttons[source_id].set_active(True)
         self.markup_check.set_active(self.conf["markup"])
         self.annotations_check.set_active(self.conf["annotations"])
+        self.territory_check.set_active(self.conf["territory"])
+        self.hud_check.set_active(self.conf["hud"])
         self.file_chooser.set_filename(self.conf["sgf_folder"])
 
     def update_conf(self):
@@ -257,6 +272,8 @@ class SSConfigWindow(gtk.Window):
                                            * 1000))
         self.conf['annotations'] = int(self.annotations_check.get_active())
         self.conf['markup'] = int(self.markup_check.get_active())
+        self.conf['territory'] = int(self.territory_check.get_active())
+        self.conf['hud'] = int(self.hud_check.get_active())
         self.conf['sgf_folder'] = self.file_chooser.get_filename()
         self.conf['sources'] = []
         for sid, checkbutton in self.source_checkbuttons.iteritems():
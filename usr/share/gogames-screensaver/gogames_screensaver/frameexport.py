@@ -0,0 +1,219 @@
+# Copyright (c) 2010 Julian Andrews.
+# All rights reserved.
+#
+# This file is part of Go Games Screensaver.
+#
+#    Go Games Screensaver is free software: you can redistribute it and/or 
+#    modify it under the terms of the GNU General Public License as 
+#    published by the Free Software Foundation, either version 3 of the 
+#    License, or (at your option) any later version.
+#
+#    Go Games Screensaver is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Go Games Screensaver.  If not, see 
+#    <http://www.gnu.org/licenses/>.
+
+import array
+import cStringIO
+import struct
+import zlib
+
+import cairo
+
+import goban_render
+
+_png_signature = '\x89PNG\r\n\x1a\n'
+
+class FrameExportError(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return "Error Exporting Frames - %s" % self.value
+
+class PNGSequenceWriter(object):
+    """Writes each frame to its own png file, named by filling in the frame
+    number in pattern, eg. "frames/%04d.png"."""
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.frames = 0
+
+    def add_frame(self, surf, area, delay):
+        surf.write_to_png(self.pattern % self.frames)
+        self.frames += 1
+
+    def close(self):
+        pass
+
+class APNGWriter(object):
+    """Writes frames to an animated png file as they're added.
+
+    After the first frame, only the area of each frame which has changed is
+    stored, drawn over the frame before it.  The number of frames has to 
+    come before the first frame, so close goes back and fills it in.  plays 
+    is the number of times to play the animation, with 0 for forever.
+
+    Frames are encoded by cairo, and their image data copied into the 
+    animation.  cairo writes opaque images as rgb and others as rgba, so
+    any frame which doesn't come out in the first frame's format is 
+    encoded again from the surface data.
+
+    """
+    def __init__(self, filename, plays=0):
+        self.file = open(filename, 'wb')
+        self.plays = plays
+        self.frames = 0
+        self.sequence = 0
+        self.actl_offset = None
+        self.ihdr = None
+
+    def add_frame(self, surf, area, delay):
+        if self.frames == 0:
+            area = (0, 0, surf.get_width(), surf.get_height())
+        x, y, width, height = area
+        if (width, height) == (surf.get_width(), surf.get_height()):
+            frame_surf = surf
+        else:
+            frame_surf = cairo.ImageSurface(0, width, height)
+            cr = cairo.Context(frame_surf)
+            cr.set_operator(cairo.OPERATOR_SOURCE)
+            cr.set_source_surface(surf, -x, -y)
+            cr.paint()
+        buff = cStringIO.StringIO()
+        frame_surf.write_to_png(buff)
+        chunks = _png_chunks(buff.getvalue())
+        if self.frames == 0:
+            self.ihdr = chunks[0][1]
+            self.file.write(_png_signature)
+            self._write_chunk('IHDR', self.ihdr)
+            self.actl_offset = self.file.tell()
+            self._write_chunk('acTL', struct.pack('>II', 0, self.plays))
+        elif not chunks[0][1][8:] == self.ihdr[8:]:
+            chunks = [('IDAT', _idat_data(frame_surf, self.ihdr))]
+        # The delay is a fraction of 16 bit numbers.
+        delay_num, delay_den = delay, 1000
+        while delay_num > 0xffff and delay_den > 1:
+            delay_num, delay_den = delay_num // 10, delay_den // 10
+        self._write_chunk('fcTL', struct.pack('>IIIIIHHBB', self.sequence, 
+                                              width, height, x, y, 
+                                              min(delay_num, 0xffff), 
+                                              delay_den, 0, 0))
+        self.sequence += 1
+        for chunk_type, data in chunks:
+            if chunk_type == 'IDAT':
+                if self.frames == 0:
+                    self._write_chunk('IDAT', data)
+                else:
+                    self._write_chunk('fdAT', struct.pack('>I', self.sequence)
+                                      + data)
+                    self.sequence += 1
+        self.frames += 1
+
+    def close(self):
+        self._write_chunk('IEND', '')
+        if not self.actl_offset is None:
+            self.file.seek(self.actl_offset)
+            self._write_chunk('acTL', struct.pack('>II', self.frames, 
+                                                  self.plays))
+        self.file.close()
+
+    def _write_chunk(self, chunk_type, data):
+        self.file.write(struct.pack('>I', len(data)) + chunk_type + data + 
+                        struct.pack('>I', zlib.crc32(chunk_type + data) & 
+                                          0xffffffff))
+
+def export_game(game_node, writer, size=512, delay=1000, renderer=None):
+    """Draw each position of the main line from game_node, size pixels 
+    wide, and pass it to writer with a delay in ms.  Returns the number of 
+    frames.
+
+    Frames are drawn as the game is played through, onto a single surface,
+    and each is handed to the writer before the next is drawn.  After the 
+    first frame, only the damaged areas of the board are redrawn, and the
+    writer is given their bounding box.
+
+    """
+    renderer = renderer or goban_render.GobanRenderer()
+    renderer.game_node = game_node
+    if not renderer.has_board(size):
+        renderer.board_size = game_node.goban.size
+        renderer.gen_board(size)
+    surf = cairo.ImageSurface(0, size, size)
+    cr = cairo.Context(surf)
+    renderer.draw(cr)
+    writer.add_frame(surf, (0, 0, size, size), delay)
+    frames = 1
+    while not game_node.child_nodes == []:
+        game_node = game_node[0]
+        renderer.game_node = game_node
+        area = _bounding_box(renderer.damaged_areas(), size)
+        cr.save()
+        cr.rectangle(*area)
+        cr.clip()
+        renderer.draw(cr)
+        cr.restore()
+        writer.add_frame(surf, area, delay)
+        frames += 1
+    return frames
+
+def _bounding_box(areas, size):
+    """Return the area covering all of areas, within a size by size image.
+    None stands for the whole image.  The area is never empty."""
+    if areas is None:
+        return (0, 0, size, size)
+    if areas == []:
+        return (0, 0, 1, 1)
+    x0 = max(0, min(x for x, y, w, h in areas))
+    y0 = max(0, min(y for x, y, w, h in areas))
+    x1 = min(size, max(x + w for x, y, w, h in areas))
+    y1 = min(size, max(y + h for x, y, w, h in areas))
+    if x1 <= x0 or y1 <= y0:
+        return (0, 0, 1, 1)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+def _idat_data(surf, ihdr):
+    """Return the compressed image data of an ARGB32 surface, in the 8 bit 
+    rgb or rgba format of the IHDR chunk data ihdr."""
+    bit_depth, color_type = struct.unpack('>BB', ihdr[8:10])
+    if not bit_depth == 8 or not color_type in (2, 6):
+        raise FrameExportError("Unsupported png format (bit depth %d, color "
+                               "type %d)" % (bit_depth, color_type))
+    surf.flush()
+    width, height, stride = (surf.get_width(), surf.get_height(), 
+                             surf.get_stride())
+    data = surf.get_data()
+    rows = []
+    for y in range(height):
+        pixels = array.array('I')
+        pixels.fromstring(str(data[y * stride:y * stride + 4 * width]))
+        row = array.array('B')
+        for p in pixels:
+            # Pixels are premultiplied native endian 0xAARRGGBB words.
+            a = p >> 24
+            if a == 0:
+                r = g = b = 0
+            else:
+                r = ((p >> 16 & 0xff) * 255 + a // 2) // a
+                g = ((p >> 8 & 0xff) * 255 + a // 2) // a
+                b = ((p & 0xff) * 255 + a // 2) // a
+            if color_type == 6:
+                row.extend((r, g, b, a))
+            else:
+                row.extend((r, g, b))
+        # Each row starts with its filter type, 0 for none.
+        rows.append('\0' + row.tostring())
+    return zlib.compress(''.join(rows))
+
+def _png_chunks(data):
+    """Return the (type, data) pairs of the chunks of a png file."""
+    chunks = []
+    i = len(_png_signature)
+    while i < len(data):
+        length, chunk_type = struct.unpack('>I4s', data[i:i + 8])
+        chunks.append((chunk_type, data[i + 8:i + 8 + length]))
+        i += 12 + length
+    return chunks
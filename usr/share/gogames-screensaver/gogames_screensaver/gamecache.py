@@ -0,0 +1,118 @@
+# Copyright (c) 2010 Julian Andrews.
+# All rights reserved.
+#
+# This file is part of Go Games Screensaver.
+#
+#    Go Games Screensaver is free software: you can redistribute it and/or 
+#    modify it under the terms of the GNU General Public License as 
+#    published by the Free Software Foundation, either version 3 of the 
+#    License, or (at your option) any later version.
+#
+#    Go Games Screensaver is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Go Games Screensaver.  If not, see 
+#    <http://www.gnu.org/licenses/>.
+
+import hashlib
+import os
+import pickle
+import warnings
+
+class GameCache(object):
+    """On disk cache of compiled games (see gogame.compile_game).
+
+    Entries are stored one per file, and the least recently used ones are
+    removed once the cache grows past max_size bytes.  The cache is only an
+    optimisation, so a folder which can't be written to just leaves games
+    uncached.
+
+    """
+    version = 2
+    max_size = 20 * 1024 * 1024
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.size = None
+
+    def filename(self, key):
+        digest = hashlib.sha1(repr((self.version, key))).hexdigest()
+        return os.path.join(self.folder, "%s.pickle" % digest)
+
+    def load(self, key):
+        filename = self.filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                stored_key, compiled = pickle.load(f)
+        except IOError:
+            return None
+        except Exception:
+            # Unpickling a corrupt file can raise almost anything.
+            self.remove(filename)
+            return None
+        if not stored_key == key:
+            return None
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return compiled
+
+    def store(self, key, compiled):
+        filename = self.filename(key)
+        temp_filename = filename + ".tmp"
+        try:
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder, 0700)
+            if self.size is None:
+                self.size = sum(size for mtime, size, name in 
+                                self.entries())
+            with open(temp_filename, 'wb') as f:
+                pickle.dump((key, compiled), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_filename, filename)
+            self.size += os.path.getsize(filename)
+        except (IOError, OSError), e:
+            warnings.warn("Couldn't store game in cache - %s" % e)
+            try:
+                os.remove(temp_filename)
+            except OSError:
+                pass
+            return
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        entries = sorted(self.entries())
+        self.size = sum(size for mtime, size, filename in entries)
+        for mtime, size, filename in entries:
+            if self.size <= self.max_size:
+                break
+            self.remove(filename)
+
+    def remove(self, filename):
+        try:
+            size = os.path.getsize(filename)
+            os.remove(filename)
+        except OSError:
+            return
+        if not self.size is None:
+            self.size -= size
+
+    def entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.folder)
+        except OSError:
+            return entries
+        for name in names:
+            if os.path.splitext(name)[1] == ".pickle":
+                filename = os.path.join(self.folder, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, filename))
+        return entries
@@ -0,0 +1,515 @@
+# Copyright (c) 2010 Julian Andrews.
+# All rights reserved.
+#
+# This file is part of Go Games Screensaver.
+#
+#    Go Games Screensaver is free software: you can redistribute it and/or 
+#    modify it under the terms of the GNU General Public License as 
+#    published by the Free Software Foundation, either version 3 of the 
+#    License, or (at your option) any later version.
+#
+#    Go Games Screensaver is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Go Games Screensaver.  If not, see 
+#    <http://www.gnu.org/licenses/>.
+#
+# Todo
+#   Support LB markup property
+#   Optionally draw coordinates around board edge?
+
+import cairo
+import collections
+import math
+import os
+import rsvg
+
+import perfstats
+from constants import data_folder
+
+class GobanRenderer(object):
+    """Draws the position at game_node with cairo.
+
+    A GobanRenderer only needs a cairo context to draw on, so it can be 
+    used without a display.  GobanDisplay draws through one in a gtk 
+    widget.
+
+    """
+    stone_svgs = {-1: rsvg.Handle(os.path.join(data_folder, "images", 
+                                               "white_stone.svg")),
+                  1: rsvg.Handle(os.path.join(data_folder, "images", 
+                                             "black_stone.svg"))}
+    hoshi_lists = {9: ((3,3), (3,7), (7,3), (7,7)),
+                   13: ((4,4), (4,10), (7,7), (10,4), (10,10)),
+                   19: ((4,4), (4,10), (4,16),
+                        (10,4), (10,10), (10,16),
+                        (16,4), (16,10), (16,16))}
+    bg_color = (0.0, 0.0, 0.0)
+    board_color = (0.9, 0.73, 0.37)
+    line_color = (0.0, 0.0, 0.0)
+    markup_colors = {1: (0.8, 0.8, 0.8), -1: (0.2, 0.2, 0.2), 
+                     0: (1.0, 1.0, 1.0)}
+    markup_line_cols = {"LN": (0.0, 0.0, 1.0), "AR": (0.0, 1.0, 0.0)}
+    territory_colors = {1: (0.0, 0.0, 0.0, 0.5), -1: (1.0, 1.0, 1.0, 0.6)}
+    SL_color = (0.2, 0.75, 0.2)
+    board_margin = 14.1
+    line_spacing = 22.0
+    line_width = 1.0
+    heavy_line_width = 2.0
+    markup_line_width = 1.5
+    hoshi_radius = 2.0
+    point_markup = ('CR', 'DD', 'MA', 'SL', 'SQ', 'TB', 'TR', 'TW')
+    board_cache = collections.OrderedDict()
+    board_cache_size = 4
+    
+    def __init__(self, should_draw_markup=True, darken=False,
+                 should_draw_territory=False):
+        self.should_draw_markup = should_draw_markup
+        self.should_draw_territory = should_draw_territory
+        self.darken = darken
+        self.board_size = 19
+        self.game_node = None
+        self.scale = None
+        self.sprites = {}
+        self.drawn_markup = (frozenset(), None)
+        self.markup_funcs = dict((prop_id, getattr(self, "draw_%s" % prop_id))
+                                 for prop_id in self.point_markup)
+
+    def has_board(self, bw):
+        """Return True if the board drawn by gen_board is bw pixels wide and
+        the size of the board at game_node."""
+        return (hasattr(self, 'clean_board_surf') and 
+                self.clean_board_surf.get_width() == bw and
+                (self.game_node is None or 
+                 self.game_node.goban.size == self.board_size))
+
+    def draw_to_file(self, size, filename):
+        """Draw the position at game_node to a png file, size pixels wide.
+
+        The board is kept between calls, so drawing later positions from the
+        same game only redraws the stones which have changed.
+
+        """
+        draw_size = max(128, size)
+        if not self.has_board(draw_size):
+            self.board_size = self.game_node.goban.size
+            self.gen_board(draw_size)
+        surf = cairo.ImageSurface(0, draw_size, draw_size)
+        self.draw(cairo.Context(surf))
+        if not draw_size == size:
+            new_surf = cairo.ImageSurface(0, size, size)
+            new_cr = cairo.Context(new_surf)
+            new_cr.scale(float(size) / draw_size, float(size) / draw_size)
+            new_cr.set_source_surface(surf)
+            new_cr.paint()
+            surf = new_surf
+        surf.write_to_png(filename)
+        
+    def draw(self, cr):
+        if not self.game_node is None:
+            self.draw_stones()
+        cr.set_source_surface(self.board_cr.get_target())
+        cr.paint()
+        if self.should_draw_markup and not self.game_node is None:
+            self.draw_markup(cr)
+        self.drawn_markup = self.markup_state()
+        if self.darken:
+            cr.set_source_rgba(0, 0, 0, 0.80)
+            cr.paint()
+
+    @staticmethod
+    def draw_MA(cr):
+        cr.move_to(0.25, 0.25)
+        cr.rel_line_to(0.5, 0.5)
+        cr.move_to(0.25, 0.75)
+        cr.rel_line_to(0.5, -0.5)
+        cr.stroke()
+
+    @staticmethod
+    def draw_CR(cr):
+        cr.move_to(0.8, 0.5)
+        cr.arc(0.5, 0.5, 0.3, 0, 2 * math.pi)
+        cr.stroke()
+        
+    @staticmethod
+    def draw_TR(cr):
+        s = math.sqrt(3)
+        cr.move_to(0.5, 0.2)
+        cr.line_to(0.5 - 0.15 * s, 0.65)
+        cr.line_to(0.5 + 0.15 * s, 0.65)
+        cr.close_path()
+        cr.stroke()
+        
+    @staticmethod
+    def draw_SQ(cr):
+        cr.rectangle(0.25, 0.25, 0.5, 0.5)
+        cr.stroke()
+    
+    @classmethod
+    def draw_SL(cls, cr):
+        cr.set_source_rgb(*cls.SL_color)
+        cls.draw_MA(cr)
+        
+    def draw_TB(self, cr):
+        self.draw_Tx(cr, 1)
+    
+    def draw_TW(self, cr):
+        self.draw_Tx(cr, -1)
+        
+    def draw_Tx(self, cr, col):
+        cr.save()
+        cr.translate(0.25, 0.25)
+        cr.scale(0.5, 0.5)
+        self.draw_sprite(cr, col, 1.0)
+        cr.restore()
+        
+    @classmethod
+    def draw_DD(cls, cr):
+        pass
+
+    @classmethod
+    def draw_territory(cls, cr, owner):
+        cr.set_source_rgba(*cls.territory_colors[owner])
+        cr.rectangle(0.35, 0.35, 0.3, 0.3)
+        cr.fill()
+        
+    @staticmethod
+    def draw_plus(cr):
+        cr.move_to(0.5, 0.25)
+        cr.rel_line_to(0, 0.5)
+        cr.move_to(0, 0)
+        cr.rel_move_to(0.25, 0.5)
+        cr.rel_line_to(0.5, 0)
+        cr.stroke()
+        
+    @classmethod
+    def draw_hoshi(cls, cr):
+        cr.set_source_rgb(*cls.line_color)
+        cr.arc(0.5, 0.5, cls.hoshi_radius/cls.line_spacing, 0, 2 * math.pi)
+        cr.fill()
+    
+    @classmethod
+    def draw_not_showing(cls, cr):
+        cr.set_source_rgba(*(list(cls.bg_color) + [0.8]))
+        cr.rectangle(0, 0, 1, 1)
+        cr.fill()
+
+    def draw_empty(self, cr):
+        cr.save()
+        cr.rectangle(0, 0, 1, 1)
+        cr.identity_matrix()
+        cr.set_source_surface(self.clean_board_surf)
+        cr.fill()
+        cr.restore()
+        return
+
+    def draw_stone(self, cr, color, alpha):
+        self.draw_empty(cr)
+        self.draw_sprite(cr, color, alpha)
+
+    def draw_sprite(self, cr, color, alpha):
+        """Fill the unit square with the sprite of a stone."""
+        size = cr.user_to_device_distance(1, 0)[0]
+        sprite = self.stone_sprite(color, alpha, size)
+        x, y = [int(round(v)) for v in cr.user_to_device(0, 0)]
+        cr.save()
+        cr.identity_matrix()
+        cr.set_source_surface(sprite, x, y)
+        cr.rectangle(x, y, sprite.get_width(), sprite.get_height())
+        cr.fill()
+        cr.restore()
+
+    def stone_sprite(self, color, alpha, size):
+        """Return a surface with the stone svg rendered at size pixels wide.
+
+        Rendering an svg is slow, so each (color, alpha, size) is rendered 
+        once and kept until gen_board changes the scale.
+
+        """
+        key = (color, alpha, size)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = cairo.ImageSurface(0, int(math.ceil(size)), 
+                                        int(math.ceil(size)))
+            cr = cairo.Context(sprite)
+            svg = self.stone_svgs[color]
+            cr.scale(size / svg.props.width, size / svg.props.width)
+            cr.push_group()
+            svg.render_cairo(cr)
+            cr.pop_group_to_source()
+            cr.paint_with_alpha(alpha)
+            self.sprites[key] = sprite
+        return sprite
+        
+    @perfstats.timed('gen_board')
+    def gen_board(self, bw):
+        """Sets self.clean_board_surf, self.board_cr, and self.scale"""
+        scale = bw / (2.0 * self.board_margin + 
+                      (self.board_size - 1.0) * self.line_spacing)
+        if not self.scale == scale:
+            self.sprites = {}
+        self.scale = scale
+        self.clean_board_surf = self.clean_board(bw)
+        board_surf = cairo.ImageSurface(0, bw, bw)
+        self.board_cr = cairo.Context(board_surf)
+        self.board_cr.set_source_surface(self.clean_board_surf)
+        self.board_cr.paint()
+        self.old_stones = {}
+        self.markup_cr = cairo.Context(cairo.ImageSurface(0, bw, bw))
+        self.view_cr = cairo.Context(cairo.ImageSurface(0, bw, bw))
+        self.layer_marks = frozenset()
+        self.layer_view = None
+
+    def clean_board(self, bw):
+        """Return a surface with an empty board of board_size drawn bw pixels 
+        wide.
+
+        The last board_cache_size boards drawn are kept in board_cache, 
+        shared between all displays, so that switching between board sizes 
+        or back to an earlier window size doesn't redraw the board.  The 
+        surfaces are only ever used as a source, and mustn't be drawn on.
+
+        """
+        key = (self.board_size, bw)
+        surf = self.board_cache.pop(key, None)
+        if surf is None:
+            surf = self.draw_clean_board(bw)
+            while len(self.board_cache) >= self.board_cache_size:
+                self.board_cache.popitem(last=False)
+        self.board_cache[key] = surf
+        return surf
+
+    def draw_clean_board(self, bw):
+        surf = cairo.ImageSurface(0, bw, bw)
+        cr = cairo.Context(surf)
+        cr.set_source_rgb(*self.board_color)
+        cr.rectangle(0, 0, bw, bw)
+        cr.fill()
+        cr.set_source_rgb(*self.line_color)
+        cr.set_line_width(max(1, int(self.heavy_line_width * self.scale)))
+        cr.rectangle(*(self.point_map((1, 1)) + [self.real_line_spacing() * 
+                       (self.board_size -1)]*2))
+        cr.stroke()
+        cr.set_line_width(max(1, int(self.line_width * self.scale)))
+        for i in (0, 1):
+            for j in range(2, self.board_size):
+                start = self.point_map((1, j) if i == 0 else (j, 1))
+                end = self.point_map((self.board_size, j) if i == 0 else 
+                                     (j, self.board_size))
+                if self.scale < 1:
+                    start = self.sharp_line_endpoint(cr, start)
+                    end = self.sharp_line_endpoint(cr, end)
+                cr.move_to(*start)
+                cr.line_to(*end)
+            cr.stroke()
+        hoshi_list = self.hoshi_lists.get(self.board_size, ())
+        cr.set_source_rgb(*self.line_color)
+        for point in hoshi_list:
+            self.draw_at_point(cr, self.draw_hoshi, 0, point)
+        return surf
+
+    @staticmethod
+    def sharp_line_endpoint(cr, point):
+        return cr.device_to_user(*(int(x) + 0.5 for x in 
+                                   cr.user_to_device(*point)))
+        
+    @perfstats.timed('draw_stones')
+    def draw_stones(self):
+        """Redraw the points whose stone, transparency or territory owner has
+        changed since the last call, and return them."""
+        alphas = {}
+        for prop_id in ("TB", "TW", "DD"):
+            for point in self.game_node.markup.get(prop_id, ()):
+                alphas[point] = True
+        goban = self.game_node.goban
+        if self.should_draw_territory:
+            owners = self.game_node.cursor.track_influence().owners
+        else:
+            owners = {}
+        empty_state = (0, False, 0)
+        changed_points = []
+        for point, color in goban.iteritems():
+            state = (color, not color == 0 and alphas.get(point, False),
+                     owners.get(point, 0))
+            if not self.old_stones.get(point, empty_state) == state:
+                changed_points.append((point, state))
+        for point, state in changed_points:
+            color, alpha, owner = state
+            if state == empty_state:
+                del self.old_stones[point]
+            else:
+                self.old_stones[point] = state
+            if color == 0:
+                self.draw_at_point(self.board_cr, self.draw_empty, 0, point)
+            else:
+                self.draw_at_point(self.board_cr, self.draw_stone, 0, point,
+                                   (color, 0.5 if alpha else 1.0))
+            if owner:
+                self.draw_at_point(self.board_cr, self.draw_territory, 0,
+                                   point, (owner,))
+        return [point for point, state in changed_points]
+
+    def markup_state(self):
+        """Return the markup drawn by draw_markup, as a set of (prop_id, 
+        point, color of the stone at point) marks, with the last move as a 
+        'plus' mark and lines as (prop_id, point pair, 0), and the VW point
+        set."""
+        if not self.should_draw_markup or self.game_node is None:
+            return frozenset(), None
+        goban = self.game_node.goban
+        marks = set()
+        for prop_id, prop_vals in self.game_node.markup.iteritems():
+            if prop_id in ('AR', 'LN'):
+                marks.update((prop_id, val, 0) for val in prop_vals)
+            elif not prop_id in ('LB', 'VW'):
+                marks.update((prop_id, val, goban[val]) for val in prop_vals)
+        if not goban.last_stone == None:
+            marks.add(('plus', goban.last_stone, goban[goban.last_stone]))
+        return marks, self.game_node.markup.get('VW')
+
+    def damaged_areas(self):
+        """Return the (x, y, width, height) areas which need to be redrawn 
+        after game_node has been changed, or None if the whole board does.
+
+        Changed stones are drawn onto the board straight away, so the areas
+        are those of the changed points, of markup which has been added or 
+        removed, and of the old and new last move.
+
+        """
+        marks, view = self.markup_state()
+        old_marks, old_view = self.drawn_markup
+        if not view is old_view:
+            return None
+        areas = [self.point_area(point) for point in self.draw_stones()]
+        for prop_id, val, color in marks.symmetric_difference(old_marks):
+            if prop_id in ('AR', 'LN'):
+                areas.append(self.line_area(val))
+            else:
+                areas.append(self.point_area(val))
+        return areas
+
+    def point_area(self, point):
+        """Return the (x, y, width, height) area covered by a point."""
+        s = self.real_line_spacing()
+        x, y = self.point_map(point)
+        return (int(x - s / 2) - 1, int(y - s / 2) - 1, int(s) + 3, 
+                int(s) + 3)
+
+    def line_area(self, (a, b)):
+        """Return the area covered by a line or arrow between two points."""
+        m = int(max(self.real_line_spacing(), 20 * self.scale))
+        (x0, y0), (x1, y1) = self.point_map(a), self.point_map(b)
+        x, y = int(min(x0, x1)) - m, int(min(y0, y1)) - m
+        return (x, y, int(abs(x1 - x0)) + 2 * m + 1, 
+                int(abs(y1 - y0)) + 2 * m + 1)
+
+    @perfstats.timed('draw_markup')
+    def draw_markup(self, cr):
+        """Paint the markup layers, bringing them up to date first.
+
+        Markup is drawn onto two cached layers: one for the marks and one 
+        for the points hidden by VW.  A layer is only redrawn when its 
+        markup changes, so exposes which don't change the markup just paint
+        the layers.
+
+        """
+        marks, view = self.markup_state()
+        if not marks == self.layer_marks:
+            self.update_markup_layer(marks)
+        if not view is self.layer_view:
+            self.update_view_layer(view)
+        cr.set_source_surface(self.markup_cr.get_target())
+        cr.paint()
+        if not view is None:
+            cr.set_source_surface(self.view_cr.get_target())
+            cr.paint()
+
+    def update_markup_layer(self, marks):
+        """Redraw the marks layer, clearing only the areas of the old and new
+        marks."""
+        cr = self.markup_cr
+        cr.save()
+        cr.set_operator(cairo.OPERATOR_CLEAR)
+        for prop_id, val, color in self.layer_marks | marks:
+            if prop_id in ('AR', 'LN'):
+                cr.rectangle(*self.line_area(val))
+            else:
+                cr.rectangle(*self.point_area(val))
+        cr.fill()
+        cr.restore()
+        for prop_id, val, color in marks:
+            if prop_id in ('AR', 'LN'):
+                self.draw_line(cr, val, prop_id)
+            elif prop_id == 'plus':
+                self.draw_at_point(cr, self.draw_plus, color, val)
+            else:
+                self.draw_at_point(cr, self.markup_funcs[prop_id], color, val)
+        self.layer_marks = marks
+
+    def update_view_layer(self, view):
+        """Redraw the layer covering the points outside of view (VW)."""
+        cr = self.view_cr
+        cr.save()
+        cr.set_operator(cairo.OPERATOR_CLEAR)
+        cr.paint()
+        cr.restore()
+        if not view is None:
+            for point in self.game_node.goban:
+                if not point in view:
+                    self.draw_at_point(cr, self.draw_not_showing, 0, point)
+        self.layer_view = view
+                               
+    def draw_at_point(self, cr, draw_func, stone_color, point, args=()):
+        cr.save()
+        cr.identity_matrix()
+        cr.set_source_rgb(*self.markup_colors[stone_color])
+        s = self.real_line_spacing()
+        cr.translate(*self.point_map(point))
+        cr.scale(s, s)
+        cr.translate(*cr.device_to_user(*map(int, cr.user_to_device(-0.5, 
+                                                                    -0.5))))
+        cr.set_line_width(self.markup_line_width/self.real_line_spacing())
+        draw_func(cr, *args)
+        cr.restore()
+
+    def draw_line(self, cr, (a, b), prop_id):
+        col = self.markup_line_cols[prop_id]
+        cr.set_line_width(max(1, int(self.markup_line_width * self.scale)))
+        cr.set_source_rgb(*col)
+        start = self.point_map(a)
+        end = self.point_map(b)
+        cr.move_to(*start)
+        cr.line_to(*end)
+        cr.stroke()
+        if prop_id == 'AR':
+            arrowhead_height = 20
+            arrowhead_width = 7
+            theta = math.atan2(a[1]-b[1], a[0]-b[0]) - math.pi/2
+            cr.translate(*end)
+            cr.rotate(theta)
+            cr.translate(-end[0], -end[1])
+            cr.move_to(*end)
+            cr.rel_line_to(arrowhead_width * self.scale / 2, 
+                           arrowhead_height * self.scale / 2)
+            cr.rel_line_to(-arrowhead_width * self.scale, 0)
+            cr.close_path()
+            cr.fill()
+            cr.identity_matrix()
+
+    def point_map(self, point):
+        bw = int(self.scale * (2 * self.board_margin + (self.board_size - 1) * 
+                               self.line_spacing))
+        l = self.real_line_spacing()
+        m = (bw - (self.board_size - 1) * l) / 2
+        return [m + l * (x - 1) for x in point]
+        
+    def real_line_spacing(self):
+        if self.scale > 1:
+            return 2 * int(round(self.scale * (self.board_size - 1) * \
+                   self.line_spacing) / (self.board_size - 1) / 2)
+        else:
+            return self.scale * self.line_spacing
+
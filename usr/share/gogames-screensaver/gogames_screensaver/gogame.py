@@ -20,12 +20,22 @@
 # Todo
 #   Support alternative board sizes
 
-import sys
+import array
+import collections
+import itertools
+import operator
+import random
 
 import sgfparse
 import sgfverify
 
 color_mapping = {'B':1, 'W':-1, 'E':0}
+_compiled_props = frozenset(['SZ', 'MN'] + [prop_id for prop_id, info in 
+                            sgfverify.property_info.iteritems() if info[1] in 
+                            ('move', 'setup', 'game-info', 'annotation', 
+                             'move-annotation', 'markup')])
+# Shared by every node without annotations, so must not be written.
+_no_properties = {}
 
 class GogameError(Exception):
     def __init__(self, value, data):
@@ -35,21 +45,107 @@ class GogameError(Exception):
     def __str__(self):
         return "Error Generating Gogame - %s" % self.value
 
-class Goban(dict):
+class _BoardTables(object):
+    """Lookup tables shared by all boards of one size.
+
+    Boards are stored as a flat array of (size + 2) ** 2 cells, with a border
+    of off board cells around the edge, so the four neighbors of any point 
+    can be found without bounds checks.
+
+    """
+    _tables = {}
+
+    def __init__(self, size):
+        width = size + 2
+        self.points = [(x, y) for x in range(1, size + 1) for 
+                       y in range(1, size + 1)]
+        self.indices = dict((p, p[0] * width + p[1]) for p in self.points)
+        self.index_points = [None] * (width * width)
+        for point, i in self.indices.iteritems():
+            self.index_points[i] = point
+        self.neighbors = [(i - width, i + width, i - 1, i + 1) for i in 
+                          range(width * width)]
+        self.get_points = operator.itemgetter(*(self.indices[p] for p in 
+                                                self.points))
+        self.empty_board = array.array('b', [Goban.off_board] * width * width)
+        for i in self.indices.itervalues():
+            self.empty_board[i] = 0
+        # Zobrist keys, the same for every run so hashes can be stored.
+        rand = random.Random(size)
+        self.zobrist = {0: [0] * (width * width),
+                        1: [rand.getrandbits(64) for i in range(width * width)],
+                        -1: [rand.getrandbits(64) for i in range(width * width)]}
+        self.symmetries = []
+        for transform in (lambda x, y: (x, y), lambda x, y: (y, x),
+                          lambda x, y: (size + 1 - x, y),
+                          lambda x, y: (x, size + 1 - y),
+                          lambda x, y: (size + 1 - x, size + 1 - y),
+                          lambda x, y: (size + 1 - y, x),
+                          lambda x, y: (y, size + 1 - x),
+                          lambda x, y: (size + 1 - y, size + 1 - x)):
+            symmetry = [0] * (width * width)
+            for point, i in self.indices.iteritems():
+                symmetry[i] = self.indices[transform(*point)]
+            self.symmetries.append(symmetry)
+
+    @classmethod
+    def for_size(cls, size):
+        tables = cls._tables.get(size)
+        if tables is None:
+            tables = cls._tables[size] = cls(size)
+        return tables
+
+class Goban(collections.Mapping):
+    """A go board, presented as a mapping from points to colors.
+
+    hash is a 64 bit Zobrist hash of the stones on the board, kept up to date
+    as stones are added and removed.
+
+    """
 
     _char_map = {None: ' ', 1: 'B', -1: 'W', 0: '.'}
+    off_board = 2
 
     def __init__(self, goban = None, size = 19):
         if not goban is None:
             self.size = goban.size
             self.prisoners = dict(goban.prisoners)
             self.move_number = goban.move_number
+            self.board = goban.board[:]
+            self.hash = goban.hash
+            self.chains = goban.chains and goban.chains[:]
+            # Chains are now shared, so neither board may modify them in place.
+            goban._token = object()
         else:
             self.size = size
             self.move_number = 0
             self.prisoners = {1:0, -1:0}
-        dict.__init__(self, goban or self._default_goban(size))
+            self.board = _BoardTables.for_size(size).empty_board[:]
+            self.hash = 0
+            self.chains = [None] * len(self.board)
+        self.tables = _BoardTables.for_size(self.size)
         self.last_stone = None
+        self.journal = None
+        self._token = object()
+
+    def __getitem__(self, point):
+        return self.board[self.tables.indices[point]]
+
+    def __iter__(self):
+        return iter(self.tables.points)
+
+    def __len__(self):
+        return len(self.tables.points)
+
+    def __contains__(self, point):
+        return point in self.tables.indices
+
+    def iteritems(self):
+        return itertools.izip(self.tables.points, 
+                              self.tables.get_points(self.board))
+
+    def items(self):
+        return zip(self.tables.points, self.tables.get_points(self.board))
                         
     def __str__(self):
         x_range = (min(x[0] for x in self.keys()), 
@@ -72,39 +168,212 @@ class Goban(dict):
         return s
 
     def add_stone(self, color, point):
-        self[point] = color
+        i = self.tables.indices.get(point)
+        if not i is None and not self.board[i] == color:
+            if not self.journal is None:
+                self.journal.extend((i, self.board[i], color))
+            zobrist = self.tables.zobrist
+            self.hash ^= zobrist[self.board[i]][i] ^ zobrist[color][i]
+            self.board[i] = color
+            # Setup stones are rare, so chains are rebuilt when next needed.
+            self.chains = None
         
     def play_move(self, color, point):
-        self.add_stone(color, point)
-        for n in self.neighbors(point):
-            if self[n] == -color:
-                g = Group(n, self)
-                if len(g.liberties) == 0:
-                    self.kill_group(g)
-        g = Group(point, self)
-        if len(g.liberties) == 0:
-            self.kill_group(g)
+        i = self.tables.indices.get(point)
+        if i is None:
+            # Moves off the board (such as 'tt' in old files) are passes.
+            self.move_number += 1
+            self.last_stone = None
+            return
+        if not self.board[i] == 0:
+            self.add_stone(0, point)
+        if self.chains is None:
+            self._build_chains()
+        board = self.board
+        chains = self.chains
+        neighbors = self.tables.neighbors[i]
+        board[i] = color
+        self.hash ^= self.tables.zobrist[color][i]
+        if not self.journal is None:
+            self.journal.extend((i, 0, color))
+        friends = []
+        for n in neighbors:
+            chain = chains[n]
+            if not chain is None and chain.color == color and \
+               not chain in friends:
+                friends.append(chain)
+        if friends:
+            friends.sort(key=lambda chain: len(chain.stones))
+            chain = self._writable(friends.pop())
+            for other in friends:
+                chain.stones.update(other.stones)
+                chain.liberties.update(other.liberties)
+                for j in other.stones:
+                    chains[j] = chain
+            chain.stones.add(i)
+            chain.liberties.discard(i)
+        else:
+            chain = _Chain(color, set([i]), set(), self._token)
+        chains[i] = chain
+        chain.liberties.update(n for n in neighbors if board[n] == 0)
+        for n in neighbors:
+            enemy = chains[n]
+            if not enemy is None and enemy.color == -color:
+                enemy = self._writable(enemy)
+                enemy.liberties.discard(i)
+                if not enemy.liberties:
+                    self._capture(enemy)
+        if not chains[i].liberties:
+            self._capture(chains[i])
         self.move_number += 1
         self.last_stone = point
+
+    def snapshot(self):
+        """Return a copy of the position which restore can return to.  Unlike
+        Goban(self), this leaves the board's chains alone."""
+        return _Snapshot(self)
+
+    def restore(self, goban):
+        """Set this board to the position on another board of the same size,
+        or on a snapshot of one."""
+        self.board[:] = goban.board
+        self.hash = goban.hash
+        self.prisoners = dict(goban.prisoners)
+        self.move_number = goban.move_number
+        self.last_stone = goban.last_stone
+        self.chains = None
+
+    def apply(self, delta):
+        """Step the board forward through delta."""
+        changes = delta.changes
+        for j in range(0, len(changes), 3):
+            self.board[changes[j]] = changes[j + 2]
+        self._step(delta, 1)
+
+    def undo(self, delta):
+        """Step the board back through delta."""
+        changes = delta.changes
+        for j in range(len(changes) - 3, -1, -3):
+            self.board[changes[j]] = changes[j + 1]
+        self._step(delta, 0)
+
+    def _step(self, delta, direction):
+        sign = 1 if direction else -1
+        self.prisoners = {1: self.prisoners[1] + sign * delta.prisoners[0], 
+                          -1: self.prisoners[-1] + sign * delta.prisoners[1]}
+        self.move_number = delta.move_numbers[direction]
+        self.last_stone = delta.last_stones[direction]
+        self.hash = delta.hashes[direction]
+        self.chains = None
+
+    def canonical_hash(self):
+        """Return the smallest hash of the position under the 8 symmetries of
+        the board, so positions which are rotations or reflections of each
+        other share a hash."""
+        board = self.board
+        zobrist = self.tables.zobrist
+        stones = [(i, board[i]) for i in self.tables.indices.itervalues() if
+                  not board[i] == 0]
+        hashes = []
+        for symmetry in self.tables.symmetries:
+            h = 0
+            for i, color in stones:
+                h ^= zobrist[color][symmetry[i]]
+            hashes.append(h)
+        return min(hashes)
+
+    def liberty_count(self, point):
+        """Return the number of liberties of the chain at point."""
+        if self.chains is None:
+            self._build_chains()
+        chain = self.chains[self.tables.indices[point]]
+        return 0 if chain is None else len(chain.liberties)
         
     def kill_group(self, g):
         self.prisoners[g.color] += len(g)
         for point in g.keys():
             self.add_stone(0, point)
 
+    def _capture(self, chain):
+        board = self.board
+        chains = self.chains
+        neighbors = self.tables.neighbors
+        keys = self.tables.zobrist[chain.color]
+        self.prisoners[chain.color] += len(chain.stones)
+        for i in chain.stones:
+            board[i] = 0
+            chains[i] = None
+            self.hash ^= keys[i]
+        if not self.journal is None:
+            for i in chain.stones:
+                self.journal.extend((i, chain.color, 0))
+        for i in chain.stones:
+            for n in neighbors[i]:
+                if not chains[n] is None:
+                    self._writable(chains[n]).liberties.add(i)
+
+    def _writable(self, chain):
+        """Return chain, copying it first if it's shared with another board."""
+        if chain.token is self._token:
+            return chain
+        chain = _Chain(chain.color, set(chain.stones), set(chain.liberties), 
+                       self._token)
+        for i in chain.stones:
+            self.chains[i] = chain
+        return chain
+
+    def _build_chains(self):
+        board = self.board
+        neighbors = self.tables.neighbors
+        chains = self.chains = [None] * len(board)
+        for start in self.tables.indices.itervalues():
+            color = board[start]
+            if color == 0 or not chains[start] is None:
+                continue
+            chain = _Chain(color, set([start]), set(), self._token)
+            chains[start] = chain
+            stack = [start]
+            while stack:
+                for n in neighbors[stack.pop()]:
+                    if board[n] == color and chains[n] is None:
+                        chain.stones.add(n)
+                        chains[n] = chain
+                        stack.append(n)
+                    elif board[n] == 0:
+                        chain.liberties.add(n)
+
     def neighbors(self, point):
-        points = ((point[0]-1, point[1]), (point[0]+1, point[1]),
-                  (point[0], point[1]-1), (point[0], point[1]+1))
-        return tuple(p for p in points if not self.get(p) == None)
-    
-    @staticmethod
-    def _default_goban(size):
-        goban = {}
-        for i in range(1, size + 1):
-            for j in range(1, size + 1):
-                goban[(i, j)] = 0
-        return goban
+        board = self.board
+        index_points = self.tables.index_points
+        return tuple(index_points[n] for n in 
+                     self.tables.neighbors[self.tables.indices[point]] if 
+                     not board[n] == self.off_board)
     
+class _Chain(object):
+    """A chain of connected stones and its liberties, as board indices.
+
+    Chains are only modified by the board whose token they hold.
+
+    """
+    __slots__ = ('color', 'stones', 'liberties', 'token')
+
+    def __init__(self, color, stones, liberties, token):
+        self.color = color
+        self.stones = stones
+        self.liberties = liberties
+        self.token = token
+
+class _Snapshot(object):
+    """The position on a Goban, without chains (see Goban.snapshot)."""
+    __slots__ = ('board', 'hash', 'prisoners', 'move_number', 'last_stone')
+
+    def __init__(self, goban):
+        self.board = goban.board[:]
+        self.hash = goban.hash
+        self.prisoners = dict(goban.prisoners)
+        self.move_number = goban.move_number
+        self.last_stone = goban.last_stone
+
 class Group(dict):
     def __init__(self, start_point, goban):
         self.goban = goban
@@ -112,44 +381,465 @@ class Group(dict):
         self.liberties = {}
         if self.color == 0:
             return
-        else:
-            self._expand(start_point)
-            
-    def _expand(self, p):
-        self[p] = True
-        for n in self.goban.neighbors(p):
-            if self.get(n) == None:
-                if self.goban[n] == self.color:
-                    self._expand(n)
-                elif self.goban[n] == 0:
-                    self.liberties[n] = True
+        board = goban.board
+        neighbors = goban.tables.neighbors
+        index_points = goban.tables.index_points
+        start = goban.tables.indices[start_point]
+        stones = set([start])
+        liberties = set()
+        stack = [start]
+        while stack:
+            for n in neighbors[stack.pop()]:
+                if board[n] == self.color:
+                    if not n in stones:
+                        stones.add(n)
+                        stack.append(n)
+                elif board[n] == 0:
+                    liberties.add(n)
+        for i in stones:
+            self[index_points[i]] = True
+        for i in liberties:
+            self.liberties[index_points[i]] = True
     
+class Influence(object):
+    """A rough estimate of territory from the influence of the stones.
+
+    Each stone adds its color times 2 ** (radius - distance) to every point
+    within radius of it (by Manhattan distance).  Empty points with influence
+    of at least territory_threshold belong to that color, and stones with
+    influence of the opposite color count as dead.  Since influence is a sum
+    over stones, a change to the board only updates the points around it.
+
+    owners maps each point with an owner to its color, and counts holds the
+    number of points owned by each color, including dead stones.
+
+    """
+    radius = 4
+    territory_threshold = 5
+    _kernels = {}
+
+    def __init__(self, goban):
+        self.tables = goban.tables
+        self.kernel = self._kernel(goban.size, goban.tables)
+        self.reset(goban)
+
+    @classmethod
+    def _kernel(cls, size, tables):
+        """Return, for each board index, the (index, weight) pairs of the
+        points within radius of it."""
+        kernel = cls._kernels.get(size)
+        if kernel is None:
+            kernel = [()] * len(tables.index_points)
+            for (x, y), i in tables.indices.iteritems():
+                kernel[i] = tuple((tables.indices[(x + dx, y + dy)],
+                                   2 ** (cls.radius - abs(dx) - abs(dy))) for
+                                  dx in range(-cls.radius, cls.radius + 1) for
+                                  dy in range(-cls.radius, cls.radius + 1) if
+                                  abs(dx) + abs(dy) <= cls.radius and
+                                  (x + dx, y + dy) in tables.indices)
+            cls._kernels[size] = kernel
+        return kernel
+
+    def reset(self, goban):
+        """Recompute the influence of every stone on goban."""
+        self.values = [0] * len(goban.board)
+        self.owner_at = [0] * len(goban.board)
+        self.dead_at = [0] * len(goban.board)
+        self.owners = {}
+        self.counts = {1: 0, -1: 0}
+        self.dead = {1: 0, -1: 0}
+        changes = [(i, 0, goban.board[i]) for i in
+                   self.tables.indices.itervalues() if not goban.board[i] == 0]
+        self.update(goban, itertools.chain(*changes))
+
+    def update(self, goban, changes, forward = True):
+        """Update the influence for a flat sequence of (index, old color, new
+        color) changes (see Delta) which have been made to goban, or undone
+        if forward is False."""
+        values = self.values
+        touched = set()
+        changes = iter(changes)
+        for i, old, new in itertools.izip(changes, changes, changes):
+            change = new - old if forward else old - new
+            touched.add(i)
+            for j, weight in self.kernel[i]:
+                values[j] += change * weight
+                touched.add(j)
+        board = goban.board
+        index_points = self.tables.index_points
+        for j in touched:
+            color = board[j]
+            value = values[j]
+            if color == 0:
+                owner = cmp(value, 0) if \
+                        abs(value) >= self.territory_threshold else 0
+            else:
+                owner = -color if value * color < 0 else 0
+            if self.owner_at[j]:
+                self.counts[self.owner_at[j]] -= 1
+                del self.owners[index_points[j]]
+            if self.dead_at[j]:
+                self.dead[self.dead_at[j]] -= 1
+            self.owner_at[j] = owner
+            self.dead_at[j] = color if owner else 0
+            if owner:
+                self.counts[owner] += 1
+                self.owners[index_points[j]] = owner
+            if self.dead_at[j]:
+                self.dead[color] += 1
+
+    def score(self, prisoners, komi = 0.0):
+        """Return the estimated score, positive if black is ahead, counting
+        owned points, prisoners and dead stones (which count as both)."""
+        return (self.counts[1] + self.dead[-1] + prisoners[-1] -
+                self.counts[-1] - self.dead[1] - prisoners[1] - komi)
+
+class Delta(object):
+    """The change a game node makes to the board.
+
+    changes is a flat array of (index, old color, new color) triples covering
+    stones placed, stones captured and setup stones, in the order they were
+    made.  prisoners holds the change in black and white prisoners, and
+    move_numbers, last_stones and hashes hold the values before and after the
+    node.
+
+    """
+    __slots__ = ('changes', 'prisoners', 'move_numbers', 'last_stones',
+                 'hashes')
+
+    def __init__(self, changes, prisoners, move_numbers, last_stones, hashes):
+        self.changes = changes
+        self.prisoners = prisoners
+        self.move_numbers = move_numbers
+        self.last_stones = last_stones
+        self.hashes = hashes
+
+class GameCursor(object):
+    """A single board moved forwards and backwards through a game tree.
+
+    The first time the cursor steps into a node the node is played on the
+    board and the change recorded as the node's delta.  After that, stepping
+    into or back out of the node just applies or undoes the delta.
+
+    A snapshot of the board is kept at every checkpoint_interval'th node, so
+    once a node's ancestors have been played, a jump to it replays at most
+    checkpoint_interval deltas.
+
+    Once track_influence has been called, the cursor also keeps an Influence
+    of the board up to date, from the deltas it steps through.
+
+    """
+    checkpoint_interval = 32
+
+    def __init__(self, root, goban = None):
+        self.root = root
+        self.node = None
+        self.goban = goban or Goban(size=int(root.node.get("SZ", [19])[0]))
+        self.influence = None
+        self._main_line = None
+
+    def seek(self, game_node):
+        """Move to game_node and return the board."""
+        undo, down = self._route(game_node)
+        if len(undo) + len(down) > self.checkpoint_interval:
+            node = game_node
+            path = []
+            while not node is None and len(path) < len(undo) + len(down):
+                if not node.snapshot is None:
+                    self.goban.restore(node.snapshot)
+                    if not self.influence is None:
+                        self.influence.reset(self.goban)
+                    undo, down = [], path
+                    break
+                path.append(node)
+                node = node.parent
+        for node in undo:
+            self.goban.undo(node.delta)
+            if not self.influence is None:
+                self.influence.update(self.goban, node.delta.changes, False)
+        for node in reversed(down):
+            self._enter(node)
+        self.node = game_node
+        return self.goban
+
+    def seek_move(self, n):
+        """Move to the nth node of the main line and return it.  Negative
+        values count back from the end of the game."""
+        game_node = self.main_line()[n]
+        self.seek(game_node)
+        return game_node
+
+    def forward(self, key = 0):
+        if self.node is None:
+            return self.seek(self.root)
+        return self.seek(self.node[key])
+
+    def back(self):
+        return self.seek(self.node.parent)
+
+    def track_influence(self):
+        """Start keeping an Influence of the board, and return it."""
+        if self.influence is None:
+            self.influence = Influence(self.goban)
+        return self.influence
+
+    def main_line(self):
+        """Return the nodes of the main line, from the root."""
+        if self._main_line is None:
+            game_node = self.root
+            self._main_line = [game_node]
+            while not game_node.child_nodes == []:
+                game_node = game_node.child_nodes[0]
+                self._main_line.append(game_node)
+        return self._main_line
+
+    def commented_nodes(self):
+        """Return the nodes of the main line which have comments."""
+        return [game_node for game_node in self.main_line() if
+                game_node.node.get_text('C')]
+
+    def _route(self, game_node):
+        """Return the nodes to undo, from the current node up to the nearest
+        common ancestor, and the nodes to enter, from game_node up."""
+        undo = []
+        down = []
+        node = self.node
+        while not node is game_node:
+            if node is None or game_node.depth > node.depth:
+                down.append(game_node)
+                game_node = game_node.parent
+            else:
+                undo.append(node)
+                node = node.parent
+        return undo, down
+
+    def _enter(self, game_node):
+        goban = self.goban
+        if not game_node.delta is None:
+            goban.apply(game_node.delta)
+        else:
+            self._play(game_node)
+        if not self.influence is None:
+            self.influence.update(goban, game_node.delta.changes)
+        if game_node.snapshot is None and \
+           game_node.depth % self.checkpoint_interval == 0:
+            game_node.snapshot = goban.snapshot()
+
+    def _play(self, game_node):
+        goban = self.goban
+        prisoners = (goban.prisoners[1], goban.prisoners[-1])
+        move_number = goban.move_number
+        last_stone = goban.last_stone
+        position_hash = goban.hash
+        goban.last_stone = None
+        goban.journal = array.array('h')
+        try:
+            _play_node(goban, game_node.node)
+            changes = goban.journal
+        finally:
+            goban.journal = None
+        game_node.delta = Delta(changes, (goban.prisoners[1] - prisoners[0],
+                                goban.prisoners[-1] - prisoners[1]),
+                                (move_number, goban.move_number),
+                                (last_stone, goban.last_stone),
+                                (position_hash, goban.hash))
+
+def _play_node(goban, node):
+    for prop_id in ('B', 'W'):
+        if not node.get(prop_id) == None:
+            if not node[prop_id][0] == '':
+                point = _point_from_string(node[prop_id][0])
+                goban.play_move(color_mapping[prop_id], point)
+    if not node.get('MN') == None:
+        goban.move_number = int(node['MN'][0])
+    for prop_id in ('AB', 'AW', 'AE'):
+        if not node.get(prop_id) == None:
+            for point in _points_from_pointlist(node[prop_id]):
+                goban.add_stone(color_mapping[prop_id[1]], point)
+
+class PointSet(object):
+    """An immutable list of points, held as the rectangles of an sgf point
+    list followed by the points of another PointSet, rest.
+
+    Compressed point lists ('aa:ss') are never expanded, so membership tests
+    and inheriting a large VW or DD region cost nothing per point.
+
+    """
+    __slots__ = ('rects', 'rest')
+
+    def __init__(self, rects, rest = None):
+        # Each rect is a (start, end) pair, where start is end for a point.
+        self.rects = rects
+        self.rest = rest
+
+    def __iter__(self):
+        point_set = self
+        while not point_set is None:
+            for start, end in point_set.rects:
+                if start is end:
+                    yield start
+                else:
+                    for x in range(start[0], end[0] + 1):
+                        for y in range(start[1], end[1] + 1):
+                            yield (x, y)
+            point_set = point_set.rest
+
+    def __contains__(self, point):
+        point_set = self
+        while not point_set is None:
+            for start, end in point_set.rects:
+                if start is end:
+                    if point == start:
+                        return True
+                elif start[0] <= point[0] <= end[0] and \
+                     start[1] <= point[1] <= end[1]:
+                    return True
+            point_set = point_set.rest
+        return False
+
+    def __len__(self):
+        n = 0
+        point_set = self
+        while not point_set is None:
+            for start, end in point_set.rects:
+                if start is end:
+                    n += 1
+                else:
+                    n += max(0, end[0] - start[0] + 1) * \
+                         max(0, end[1] - start[1] + 1)
+            point_set = point_set.rest
+        return n
+
+    def __repr__(self):
+        return "PointSet(%r)" % list(self)
+
+class Markup(collections.Mapping):
+    """The markup of a node, mapping property ids to a PointSet (or a list of
+    point pairs for AR and LN).
+
+    Inherited properties (see sgfverify.property_info) are held in a dict
+    shared with the parent node until a node changes them, so a node 
+    inherits its markup without copying any of it.
+
+    """
+    __slots__ = ('inherited', 'own')
+
+    def __init__(self, inherited, own):
+        self.inherited = inherited
+        self.own = own
+
+    def __getitem__(self, prop_id):
+        if prop_id in self.own:
+            return self.own[prop_id]
+        return self.inherited[prop_id]
+
+    def __iter__(self):
+        return itertools.chain(self.own, self.inherited)
+
+    def __len__(self):
+        return len(self.own) + len(self.inherited)
+
+    def iteritems(self):
+        return itertools.chain(self.own.iteritems(), 
+                               self.inherited.iteritems())
+
+_no_markup = Markup({}, {})
+
 class GameNode(object):
+    """A position in a game tree.
+
+    Child nodes, and a node's markup and annotations, are only built when
+    first used.  Nodes don't hold boards of their own: all the nodes of a
+    game share one GameCursor, and the goban property moves its board to the
+    node.  The board is only valid until another node's board is asked for.
+
+    Nodes keep their parent, and a node once built is kept by its parent's
+    child_nodes, so every node of a game which has been reached stays alive,
+    with its delta and any checkpoint snapshot, as long as any node of the
+    game does.  That history is what lets the cursor seek back through the
+    game; a played node costs about 1 kB, against a full board per node 
+    before deltas.
+
+    """
+    __slots__ = ('node', 'parent', 'game_info', 'cursor', 'depth', 
+                 'skipped_variations', 'delta', 'snapshot', '_annotations', 
+                 '_markup', '_child_nodes')
+
     def __init__(self, node, goban = None, parent = None):
-        self.child_nodes = []
-        self.goban = goban or Goban(size=int(node.get("SZ", [19])[0]))
-        self.game_info = parent.game_info if not parent == None else {}
-        self.annotations = {}
-        self.markup = {}
-        for prop_id in ('B', 'W'):
-            if not node.get(prop_id) == None:
-                if not node[prop_id][0] == '':
-                    point = _point_from_string(node[prop_id][0])
-                    self.goban.play_move(color_mapping[prop_id], point)
-        if not node.get('MN') == None:
-            self.goban.move_number = int(node['MN'][0])
-        for prop_id in ('AB', 'AW', 'AE'):
-            if not node.get(prop_id) == None:
-                for point in _points_from_pointlist(node[prop_id]):
-                    self.goban.add_stone(color_mapping[prop_id[1]], point)
+        self.node = node
+        self.parent = parent
         if not parent == None:
-            for prop_id, prop_vals in parent.markup.iteritems():
-                if sgfverify.property_info[prop_id][3] == 'inherit':
-                    self.markup[prop_id] = prop_vals
-        for prop_id, prop_vals in node.iteritems():
+            self.game_info = parent.game_info
+            self.cursor = parent.cursor
+            self.depth = parent.depth + 1
+        else:
+            self.game_info = {}
+            self.cursor = GameCursor(self, goban)
+            self.depth = 0
+        self.skipped_variations = 0
+        self.delta = None
+        self.snapshot = None
+        self._annotations = None
+        self._markup = None
+        self._child_nodes = None
+
+    @property
+    def child_nodes(self):
+        if self._child_nodes is None:
+            self._child_nodes = [GameNode(child, parent=self) for child in
+                                 self.node.child_nodes]
+        return self._child_nodes
+
+    @property
+    def goban(self):
+        return self.cursor.seek(self)
+
+    @property
+    def hash(self):
+        """The Zobrist hash of the node's position (see Goban)."""
+        if self.delta is None:
+            return self.goban.hash
+        return self.delta.hashes[1]
+
+    @property
+    def annotations(self):
+        if self._markup is None:
+            self._read()
+        return self._annotations
+
+    @property
+    def markup(self):
+        if self._markup is None:
+            self._read()
+        return self._markup
+
+    def _read(self):
+        # Read any unread ancestors first, without recursing.
+        unread = []
+        game_node = self
+        while not game_node is None and game_node._markup is None:
+            unread.append(game_node)
+            game_node = game_node.parent
+        for game_node in reversed(unread):
+            game_node._read_node()
+
+    def _read_node(self):
+        node = self.node
+        parent = self.parent
+        annotations = {}
+        parent_inherited = _no_markup.inherited if parent is None else \
+                           parent.markup.inherited
+        inherited = parent_inherited
+        own = {}
+        for prop_id in node:
             if sgfverify.property_info.get(prop_id) == None:
                 continue
             name, p_type, value, attr, game = sgfverify.property_info[prop_id]
+            if value in ('text', 'simpletext'):
+                # Left in the sgf data until it's displayed.
+                prop_vals = [node.get_text(prop_id)]
+            else:
+                prop_vals = node[prop_id]
             if p_type == 'game-info':
                 self.game_info[prop_id] = prop_vals[0]
             elif p_type in ('annotation', 'move-annotation'):
@@ -158,20 +848,31 @@ class GameNode(object):
                     val = int(val)
                 elif value == "real":
                     val = float(val)
-                self.annotations[prop_id] = val
+                annotations[prop_id] = val
+            elif p_type == 'markup' and attr == 'inherit':
+                # Copy the parent's inherited markup on the first write.
+                if inherited is parent_inherited:
+                    inherited = dict(inherited)
+                if prop_vals == ['']:
+                    inherited.pop(prop_id, None)
+                else:
+                    inherited[prop_id] = _point_set(prop_vals, 
+                                                    inherited.get(prop_id))
             elif p_type == 'markup':
-                old_markup = self.markup.get(prop_id)
-                if attr == 'inherit' and prop_vals == ['']:
-                    if not old_markup is None:
-                        del self.markup[prop_id]
-                elif value in ('l-point', 'el-point'):
-                    self.markup[prop_id] = _points_from_pointlist(prop_vals) + (old_markup or [])
+                if value in ('l-point', 'el-point'):
+                    own[prop_id] = _point_set(prop_vals)
                 elif value in 'l-point:point':
-                    self.markup[prop_id] = [tuple(map(_point_from_string, s.split(':'))) for s in prop_vals] + (old_markup or [])
+                    own[prop_id] = [tuple(map(_point_from_string, s.split(':'))) for s in prop_vals]
+        self._annotations = annotations or _no_properties
+        if own == {} and inherited is parent_inherited and \
+           not parent is None and parent.markup.own == {}:
+            # Nothing has changed, so share the parent's markup.
+            self._markup = parent.markup
+        elif own == {} and inherited == {}:
+            self._markup = _no_markup
+        else:
+            self._markup = Markup(inherited, own)
 
-        for child in node.child_nodes:
-            self.child_nodes.append(GameNode(child, Goban(self.goban), self))
-        
     def __getitem__(self, key):
         return self.child_nodes[key]
 
@@ -184,6 +885,16 @@ def _points_from_pointlist(l):
             points.append(_point_from_string(s))
     return points
 
+def _point_set(l, rest = None):
+    rects = []
+    for s in l:
+        if ':' in s:
+            start, end = map(_point_from_string, s.split(':'))
+        else:
+            start = end = _point_from_string(s)
+        rects.append((start, end))
+    return PointSet(tuple(rects), rest)
+
 def _points_from_compose(s):
     start, end = map(_point_from_string, s.split(':'))
     points = []
@@ -202,18 +913,58 @@ def _char_to_int_coord(c):
     else:
         return val - ord('A')
 
-def game_nodes_from_file(filename):
-    with open(filename) as f:
-        data = f.read()
-    return game_nodes_from_data(data)
+def game_nodes_from_file(filename, main_line_only=False):
+    return game_nodes_from_data(sgfparse.read_file(filename), main_line_only)
+
+def game_nodes_from_data(data, main_line_only=False):
+    """Return a GameNode for each game in data.
+
+    With main_line_only set, variations are dropped before verification and
+    only the main line of each game is built.  The number of variations
+    dropped is stored in the skipped_variations attribute of each game.
+
+    """
+    game_nodes = []
+    for node, skipped_variations in _verified_trees(data, main_line_only):
+        game_node = GameNode(node)
+        game_node.skipped_variations = skipped_variations
+        game_nodes.append(game_node)
+    return game_nodes
+
+def compile_game(data):
+    """Return a compact, pre-verified form of the first game in data.
+
+    The result holds the number of variations skipped and, for each main line
+    node, a dict of just the properties GameNode uses.  It can be pickled and
+    passed to game_node_from_compiled later on without any parsing or 
+    verification.
+
+    """
+    node, skipped_variations = _verified_trees(data, main_line_only=True)[0]
+    nodes = []
+    while True:
+        nodes.append(dict((prop_id, node[prop_id]) for prop_id in node 
+                          if prop_id in _compiled_props))
+        if node.child_nodes == []:
+            break
+        node = node.child_nodes[0]
+    return skipped_variations, nodes
+
+def game_node_from_compiled(compiled):
+    skipped_variations, nodes = compiled
+    game_node = GameNode(sgfparse.Tree.from_sequence(nodes).root)
+    game_node.skipped_variations = skipped_variations
+    return game_node
 
-def game_nodes_from_data(data):
-    sys.setrecursionlimit(5000)
+def _verified_trees(data, main_line_only=False):
     try:
-        c = sgfparse.parse(data)
+        c = sgfparse.parse(data, compact=True)
     except sgfparse.SGFParseError, e:
         raise GogameError("SGF parse failed: %s" % e.value, data)
+    trees = []
     for node in c:
+        skipped_variations = _prune_variations(node) if main_line_only else 0
+        trees.append((node, skipped_variations))
         try:
             sgfverify.verify_node(node)
 
@@ -226,5 +977,15 @@ def game_nodes_from_data(data):
             raise GogameError("SGF is not a Go Game!", data)
         if not node.get('SZ') in (['19'], ['13'], ['9'], None):
             raise GogameError("Unsupported board size property: %s" % node['SZ'], data)
-    return map(GameNode, c)
+    return trees
 
+def _prune_variations(node):
+    """Cut a tree down to its main line, returning the number of variations
+    removed."""
+    skipped_variations = 0
+    while not node.child_nodes == []:
+        child_nodes = node.child_nodes
+        skipped_variations += len(child_nodes) - 1
+        node.child_nodes = child_nodes[:1]
+        node = child_nodes[0]
+    return skipped_variations
@@ -17,13 +17,17 @@
 #    along with Go Games Screensaver.  If not, see 
 #    <http://www.gnu.org/licenses/>.
 
+import atexit
 import gtk
 import glib
+import os
+import signal
 import warnings
 
 import annotation_display
 import config
 import goban_display
+import perfstats
 import sgfsources
 
 import sswindow
@@ -42,7 +46,9 @@ class GobanHBox(gtk.HBox):
         self.sgf_source = sgfsources.MultiSource(conf['sources'], 
                                                  conf['sgf_folder'])
         self.goban_display = goban_display.GobanDisplay(conf['markup'], 
-                                                        conf['dark'])
+                                                        conf['dark'],
+                                                        conf['territory'],
+                                                        conf['hud'])
         self.pack_start(self.goban_display)
         self.abox = annotation_display.AnnotationDisplay()
         if conf['annotations']:
@@ -86,7 +92,7 @@ class GobanHBox(gtk.HBox):
     def run(self):
         if not self.goban_display.game_node.child_nodes == []:
             self.goban_display.game_node = self.goban_display.game_node[0]
-            self.goban_display.queue_draw()
+            self.goban_display.queue_damage()
             self.update_annotations()
             glib.timeout_add(conf['move_delay'], self.run)
         else:
@@ -96,9 +102,26 @@ class GobanHBox(gtk.HBox):
         self.abox.game_info = self.goban_display.game_node.game_info
         self.abox.annotations = self.goban_display.game_node.annotations
         self.abox.prisoners = self.goban_display.game_node.goban.prisoners
+        if conf['territory']:
+            influence = self.goban_display.game_node.cursor.track_influence()
+            self.abox.score_estimate = influence.score(self.abox.prisoners,
+                                                       self.komi())
         self.abox.update_text_output()
 
-def start():
+    def komi(self):
+        try:
+            return float(self.goban_display.game_node.game_info.get("KM", 0))
+        except ValueError:
+            return 0.0
+
+def start(start_folder=os.curdir):
+    """Run the screensaver, or its configuration dialog.  Paths given on the
+    command line are relative to start_folder."""
+    if not conf['stats_file'] is None:
+        atexit.register(perfstats.dump, os.path.join(start_folder, 
+                                                     conf['stats_file']))
+        # The screensaver is stopped with SIGTERM, which would skip atexit.
+        signal.signal(signal.SIGTERM, lambda signum, frame: gtk.main_quit())
     if conf.get('mode') == 'c':
         window = config.SSConfigWindow(conf)
     else:
@@ -0,0 +1,139 @@
+# Copyright (c) 2010 Julian Andrews.
+# All rights reserved.
+#
+# This file is part of Go Games Screensaver.
+#
+#    Go Games Screensaver is free software: you can redistribute it and/or 
+#    modify it under the terms of the GNU General Public License as 
+#    published by the Free Software Foundation, either version 3 of the 
+#    License, or (at your option) any later version.
+#
+#    Go Games Screensaver is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Go Games Screensaver.  If not, see 
+#    <http://www.gnu.org/licenses/>.
+
+import functools
+import math
+import time
+
+_CLOCK_MONOTONIC = 1
+
+def _monotonic_clock():
+    """Return a function giving the time in seconds from CLOCK_MONOTONIC, 
+    which (unlike time.time) never jumps when the system clock is set.  
+    Falls back on time.time where clock_gettime isn't available."""
+    try:
+        import ctypes
+        import ctypes.util
+    except ImportError:
+        return time.time
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+    library = ctypes.util.find_library('rt') or ctypes.util.find_library('c')
+    if library is None:
+        return time.time
+    try:
+        clock_gettime = ctypes.CDLL(library).clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+    ts = timespec()
+    ts_ref = ctypes.byref(ts)
+    if not clock_gettime(_CLOCK_MONOTONIC, ts_ref) == 0:
+        return time.time
+    def monotonic():
+        clock_gettime(_CLOCK_MONOTONIC, ts_ref)
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    return monotonic
+
+clock = _monotonic_clock()
+
+class Histogram(object):
+    """Counts of durations in seconds, in buckets a quarter of a power of 
+    two wide starting at a microsecond, so percentiles are accurate to 
+    within 19%.  last holds the most recent duration added."""
+    resolution = 1e-6
+    buckets_per_doubling = 4
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = None
+
+    def add(self, seconds):
+        if seconds > self.resolution:
+            bucket = int(math.log(seconds / self.resolution, 2) * 
+                         self.buckets_per_doubling)
+        else:
+            bucket = 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+
+    def bucket_limit(self, bucket):
+        """Return the upper limit of a bucket in seconds."""
+        return self.resolution * 2 ** ((bucket + 1.0) / 
+                                       self.buckets_per_doubling)
+
+    def percentile(self, p):
+        """Return an upper limit for the pth percentile, or None if nothing
+        has been added."""
+        if self.count == 0:
+            return None
+        rank = math.ceil(self.count * p / 100.0)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.bucket_limit(bucket), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+histograms = {}
+
+def record(stage, seconds):
+    histogram = histograms.get(stage)
+    if histogram is None:
+        histogram = histograms[stage] = Histogram()
+    histogram.add(seconds)
+
+def timed(stage):
+    """Decorate a function to record how long each call takes in the 
+    histogram for stage."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stage, clock() - start)
+        return wrapper
+    return decorator
+
+def dump(filename):
+    """Write a summary of each histogram, followed by its buckets, to 
+    filename.  Times are in ms."""
+    with open(filename, 'w') as f:
+        f.write("stage count mean p50 p90 p99 max\n")
+        for stage, h in sorted(histograms.iteritems()):
+            f.write("%s %d %.3f %.3f %.3f %.3f %.3f\n" % (stage, h.count, 
+                    1000 * h.mean(), 1000 * h.percentile(50), 
+                    1000 * h.percentile(90), 1000 * h.percentile(99), 
+                    1000 * h.max))
+        for stage, h in sorted(histograms.iteritems()):
+            f.write("\n%s\nupto count\n" % stage)
+            for bucket in sorted(h.buckets):
+                f.write("%.3f %d\n" % (1000 * h.bucket_limit(bucket), 
+                                       h.buckets[bucket]))
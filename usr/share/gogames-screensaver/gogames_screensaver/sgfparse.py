@@ -16,15 +16,20 @@
 #    You should have received a copy of the GNU General Public License
 #    along with Go Games Screensaver.  If not, see 
 #    <http://www.gnu.org/licenses/>.
-#
-# Todo:
-#    Handle error correction
 
+import array
 import collections
-import simpleparse.parser
-import simpleparse.dispatchprocessor
+import mmap
+import os
+import re
 import warnings
 
+try:
+    import simpleparse.parser
+    import simpleparse.dispatchprocessor
+except ImportError:
+    simpleparse = None
+
 _base_EBNFDeclaration = r"""
     Collection := WhiteSpace*, GameTree, (WhiteSpace*, GameTree)*
     GameTree := '(', WhiteSpace*, Sequence, 
@@ -45,12 +50,64 @@ _forgiving_EBNFDeclaration = _base_EBNFDeclaration + r"""
     ValueType := (Parenth / ('\\', []\]) / -[][])*, ?']'
     >Parenth< := '[', -']'*, ']'"""
 
+# Regular expressions matching the same tokens as the grammars above, used by
+# the hand-written parser.  Values are wrapped in "(?=(...))\\n" to stop the
+# regular expression engine backtracking into them where the grammar would not.
+_whitespace_re = re.compile(r"[ \t\r\n\v]*")
+_value_pattern = r"(?:\\[\]\\]|[^\]])*"
+_forgiving_value_pattern = r"(?:\[[^\]]*\]|\\[\]\\]|[^\[\]])*"
+
+def _compile_node_res(value):
+    ws = r"[ \t\r\n\v]*"
+    node_re = re.compile(r";(?:%s[A-Za-z]+(?:%s\[(?=(%s))\1\])+)*" % 
+                         (ws, ws, value))
+    property_re = re.compile(r"%s([A-Za-z]+)((?:%s\[(?=(%s))\3\])+)" % 
+                             (ws, ws, value))
+    value_re = re.compile(r"\[(%s)\]" % value)
+    return node_re, property_re, value_re
+
+_node_res = _compile_node_res(_value_pattern)
+_forgiving_node_res = _compile_node_res(_forgiving_value_pattern)
+_resync_re = re.compile(r"[^;()]*")
+_tree_token_re = re.compile(r"(\()|(\))|\[(?:\\.|[^\\\]])*\]", re.S)
+_tree_start_re = re.compile(r"\([ \t\r\n\v]*;")
+_escape_re = re.compile(r"\\(\r\n|\n\r|\r|\n|.)", re.S)
+
+_grammar_parsers = {}
+
+# Property ids interned for every Tree: the ids sgfverify knows about, 
+# filled in when the first Tree is built.  Other ids are interned by the 
+# tree they appear in, so the ids seen in arbitrary files don't accumulate.
+_prop_names = []
+_prop_indices = {}
+
+def _intern_known_prop_ids():
+    import sgfverify
+    for prop_id in sorted(sgfverify.property_info):
+        _prop_indices[prop_id] = len(_prop_names)
+        _prop_names.append(prop_id)
+
 class SGFParseError(Exception):
     def __init__(self, value):
         self.value = value
         
     def __str__(self):
-        return "Error Parsing SGF - %s" % value
+        return "Error Parsing SGF - %s" % self.value
+
+class _ParseFailure(Exception):
+    def __init__(self, pos):
+        self.pos = pos
+
+class Collection(list):
+    """A list of game trees.
+
+    errors holds a (position, resume position) pair for every point at which
+    the parser recovered from malformed data.
+
+    """
+    def __init__(self, trees=()):
+        super(Collection, self).__init__(trees)
+        self.errors = []
 
 class Node(collections.defaultdict):
     def __init__(self):
@@ -68,64 +125,586 @@ class Node(collections.defaultdict):
     def __str__(self):
         return self.text
 
-class _SGFProcessor(simpleparse.dispatchprocessor.DispatchProcessor):
-    def GameTree(self, (tag, start, stop, subtags), buff):
-        seqs = simpleparse.dispatchprocessor.dispatchList(self, subtags, buff)
-        tail_node = seqs[0]
-        while len(tail_node.child_nodes) > 0:
-            tail_node = tail_node.child_nodes[0]
-        for tree in seqs[1:]:
-            tail_node.child_nodes.append(tree)
-        return seqs[0]
-        
-    def Sequence(self, (tag, start, stop, subtags), buff):
-        nodes = simpleparse.dispatchprocessor.dispatchList(self, subtags, buff)
-        for nodeA, nodeB in zip(nodes, nodes[1:]):
-            nodeA.child_nodes.append(nodeB)
-            nodeB.parentNode = nodeA
-        return nodes[0]
-    
-    def Node(self, (tag, start, stop, subtags), buff):
-        props = simpleparse.dispatchprocessor.dispatchList(self, subtags, buff)
-        n = Node()
-        text = simpleparse.dispatchprocessor.getString((tag, start, stop, 
-                                                               subtags), buff)
-        n.text = text
-        for prop in props:
-            if not n.get(prop[0]) is None:
+    def split(self):
+        """Move the node's children under a new, empty child node with the
+        same text, and return the new node."""
+        node = Node()
+        node.text = self.text
+        node.child_nodes = self.child_nodes
+        for child in node.child_nodes:
+            child.parent_node = node
+        node.parent_node = self
+        self.child_nodes = [node]
+        return node
+
+    def get_text(self, prop_id):
+        """Return the first value of a property as a Text, or None."""
+        values = self.get(prop_id)
+        if values is None:
+            return None
+        return Text(values[0], 0, len(values[0]))
+
+class Text(object):
+    """A text or simpletext value, held as a span of the data it was parsed
+    from.  It is only copied out and unescaped when converted to a string,
+    and the result isn't kept, so unread values cost nothing."""
+    __slots__ = ('data', 'start', 'stop')
+
+    def __init__(self, data, start, stop):
+        self.data = data
+        self.start = start
+        self.stop = stop
+
+    def __str__(self):
+        return unescape(self.data[self.start:self.stop])
+
+    def __nonzero__(self):
+        return self.stop > self.start
+
+    def __repr__(self):
+        return "Text(%r)" % str(self)
+
+class Tree(object):
+    """A game tree held in parallel arrays rather than Node objects.
+
+    Node i has parent parents[i], first child first_children[i] and next
+    sibling next_siblings[i] (-1 for none), and the text data[text_spans[2 *
+    i]:text_spans[2 * i + 1]].  Its properties are prop_ids[j] for j in 
+    range(prop_starts[i], prop_starts[i + 1]), interned in prop_names, and 
+    the values of property j are data[value_spans[2 * k]:value_spans[2 * k + 
+    1]] for k in range(value_starts[j], value_starts[j + 1]).  Values are 
+    only copied out of data when they are read.
+
+    Nodes are read through NodeView, which behaves like a Node.  Properties
+    written through a view are held in a dict for that node from then on.
+
+    """
+    max_prop_ids = 0x10000
+
+    def __init__(self, data):
+        if _prop_names == []:
+            _intern_known_prop_ids()
+        self.data = data
+        # Shared with every tree until an unknown id is added.
+        self.prop_names = _prop_names
+        self.prop_indices = _prop_indices
+        self.parents = array.array('i')
+        self.first_children = array.array('i')
+        self.next_siblings = array.array('i')
+        self.text_spans = array.array('i')
+        self.prop_starts = array.array('i', [0])
+        self.prop_ids = array.array('H')
+        self.value_starts = array.array('i', [0])
+        self.value_spans = array.array('i')
+        self.edited = {}
+
+    @classmethod
+    def from_sequence(cls, nodes):
+        """Build a tree of a single line of nodes, each given as a dict of
+        property values."""
+        pieces = []
+        pos = 0
+        tree = cls(None)
+        for i, props in enumerate(nodes):
+            node_props = []
+            for prop_id, values in props.iteritems():
+                spans = []
+                for value in values:
+                    spans.append((pos, pos + len(value)))
+                    pieces.append(value)
+                    pos += len(value)
+                node_props.append((prop_id, spans))
+            tree.add_node(pos, pos, node_props)
+            if i > 0:
+                tree.link(i - 1, i)
+        tree.data = ''.join(pieces)
+        return tree
+
+    def __len__(self):
+        return len(self.parents)
+
+    @property
+    def root(self):
+        return NodeView(self, 0)
+
+    def add_node(self, start, stop, props):
+        """Add a node with text data[start:stop], and properties given as a
+        list of (prop_id, [(start, stop), ...]) pairs.  Return its index."""
+        for prop_id, spans in props:
+            prop_index = self.prop_indices.get(prop_id)
+            if prop_index is None:
+                prop_index = self.intern(prop_id)
+            self.prop_ids.append(prop_index)
+            for span in spans:
+                self.value_spans.extend(span)
+            self.value_starts.append(len(self.value_spans) // 2)
+        self.prop_starts.append(len(self.prop_ids))
+        self.parents.append(-1)
+        self.first_children.append(-1)
+        self.next_siblings.append(-1)
+        self.text_spans.extend((start, stop))
+        return len(self.parents) - 1
+
+    def intern(self, prop_id):
+        """Add an id to the tree's own interned ids, and return its index."""
+        if self.prop_names is _prop_names:
+            self.prop_names = list(_prop_names)
+            self.prop_indices = dict(_prop_indices)
+        prop_index = len(self.prop_names)
+        if prop_index >= self.max_prop_ids:
+            raise SGFParseError("Too many different property ids")
+        self.prop_names.append(prop_id)
+        self.prop_indices[prop_id] = prop_index
+        return prop_index
+
+    def link(self, parent, child):
+        """Make child the last child of parent."""
+        self.parents[child] = parent
+        self.next_siblings[child] = -1
+        sibling = self.first_children[parent]
+        if sibling == -1:
+            self.first_children[parent] = child
+        else:
+            while not self.next_siblings[sibling] == -1:
+                sibling = self.next_siblings[sibling]
+            self.next_siblings[sibling] = child
+
+    def props(self, i):
+        """Return a list of the (prop_id, values) pairs of node i."""
+        edited = self.edited.get(i)
+        if not edited is None:
+            return edited.items()
+        data = self.data
+        value_spans = self.value_spans
+        props = []
+        for j in range(self.prop_starts[i], self.prop_starts[i + 1]):
+            values = [data[value_spans[2 * k]:value_spans[2 * k + 1]] for k in 
+                      range(self.value_starts[j], self.value_starts[j + 1])]
+            props.append((self.prop_names[self.prop_ids[j]], values))
+        return props
+
+    def prop_ids_of(self, i):
+        """Return a list of the property ids of node i."""
+        edited = self.edited.get(i)
+        if not edited is None:
+            return edited.keys()
+        prop_names = self.prop_names
+        return [prop_names[prop_index] for prop_index in 
+                self.prop_ids[self.prop_starts[i]:self.prop_starts[i + 1]]]
+
+    def get(self, i, prop_id):
+        """Return the values of a property of node i, or None."""
+        edited = self.edited.get(i)
+        if not edited is None:
+            return edited.get(prop_id)
+        prop_index = self.prop_indices.get(prop_id)
+        for j in range(self.prop_starts[i], self.prop_starts[i + 1]):
+            if self.prop_ids[j] == prop_index:
+                return [self.data[self.value_spans[2 * k]:
+                                  self.value_spans[2 * k + 1]] for k in 
+                        range(self.value_starts[j], self.value_starts[j + 1])]
+        return None
+
+    def get_text(self, i, prop_id):
+        """Return the first value of a property of node i as a Text, or 
+        None."""
+        if i in self.edited:
+            values = self.edited[i].get(prop_id)
+            return None if values is None else Text(values[0], 0, 
+                                                    len(values[0]))
+        prop_index = self.prop_indices.get(prop_id)
+        for j in range(self.prop_starts[i], self.prop_starts[i + 1]):
+            if self.prop_ids[j] == prop_index:
+                k = self.value_starts[j]
+                return Text(self.data, self.value_spans[2 * k], 
+                            self.value_spans[2 * k + 1])
+        return None
+
+    def edit(self, i):
+        """Return a dict of the properties of node i which can be written."""
+        edited = self.edited.get(i)
+        if edited is None:
+            edited = self.edited[i] = dict(self.props(i))
+        return edited
+
+class NodeView(collections.MutableMapping):
+    """Node i of a Tree, with the same interface as Node."""
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def __getitem__(self, prop_id):
+        values = self.tree.get(self.index, prop_id)
+        if values is None:
+            # Missing properties read as empty lists, as with a Node.
+            values = self.tree.edit(self.index)[prop_id] = []
+        return values
+
+    def get(self, prop_id, default=None):
+        values = self.tree.get(self.index, prop_id)
+        return default if values is None else values
+
+    def get_text(self, prop_id):
+        return self.tree.get_text(self.index, prop_id)
+
+    def __contains__(self, prop_id):
+        return not self.tree.get(self.index, prop_id) is None
+
+    def __setitem__(self, prop_id, values):
+        self.tree.edit(self.index)[prop_id] = values
+
+    def __delitem__(self, prop_id):
+        del self.tree.edit(self.index)[prop_id]
+
+    def __iter__(self):
+        return iter(self.tree.prop_ids_of(self.index))
+
+    def __len__(self):
+        return len(self.tree.prop_ids_of(self.index))
+
+    def keys(self):
+        return self.tree.prop_ids_of(self.index)
+
+    def iteritems(self):
+        return iter(self.tree.props(self.index))
+
+    def items(self):
+        return self.tree.props(self.index)
+
+    @property
+    def text(self):
+        tree = self.tree
+        if tree.data is None:
+            return ''
+        return tree.data[tree.text_spans[2 * self.index]:
+                         tree.text_spans[2 * self.index + 1]]
+
+    @property
+    def parent_node(self):
+        parent = self.tree.parents[self.index]
+        return None if parent == -1 else NodeView(self.tree, parent)
+
+    @property
+    def child_nodes(self):
+        children = []
+        child = self.tree.first_children[self.index]
+        while not child == -1:
+            children.append(NodeView(self.tree, child))
+            child = self.tree.next_siblings[child]
+        return children
+
+    @child_nodes.setter
+    def child_nodes(self, children):
+        self.tree.first_children[self.index] = -1
+        for child in children:
+            self.tree.link(self.index, child.index)
+
+    def split(self):
+        tree = self.tree
+        i = tree.add_node(tree.text_spans[2 * self.index], 
+                          tree.text_spans[2 * self.index + 1], [])
+        node = NodeView(tree, i)
+        node.child_nodes = self.child_nodes
+        self.child_nodes = [node]
+        return node
+
+    def __repr__(self):
+        return "Node(" + repr(dict(self.iteritems())) + ")"
+
+    def __str__(self):
+        return self.text
+
+class _Parser(object):
+    """Single pass SGF parser building the same trees as the grammar.
+
+    With recover set, malformed data doesn't abort the parse.  A node which
+    fails in strict mode is retried in forgiving mode, and failing that the
+    parser skips to the next ';', '(' or ')' and carries on with the nodes it
+    already has.
+
+    """
+    def __init__(self, data, forgiving_mode=False, recover=False):
+        self.data = data
+        self.recover = recover
+        self.node_res = _forgiving_node_res if forgiving_mode else _node_res
+        self.retry_node_res = None if forgiving_mode else _forgiving_node_res
+        self.collection = Collection()
+
+    def parse(self):
+        data = self.data
+        match_ws = _whitespace_re.match
+        collection = self.collection
+        pos = match_ws(data).end()
+        while pos < len(data):
+            if not data[pos:pos + 1] == '(':
+                resume = data.find('(', pos)
+                if not self.recover or resume == -1:
+                    break
+                pos = self.error(pos, resume)
+            try:
+                root, pos = self.parse_game_tree(pos)
+            except _ParseFailure:
+                break
+            if not root is None:
+                collection.append(root)
+            pos = match_ws(data, pos).end()
+        return collection
+
+    def parse_game_tree(self, pos):
+        data = self.data
+        match_ws = _whitespace_re.match
+        # Each frame is [parent node, last node of sequence, has variations]
+        frames = []
+        root = None
+        while True:
+            c = data[pos:pos + 1]
+            if c == ';':
+                if not frames or frames[-1][2]:
+                    # Nodes after variations are dropped.
+                    m, node_res = self.match_node(pos)
+                    pos = self.error(pos, m.end())
+                    continue
+                node, pos = self.parse_node(pos)
+                frame = frames[-1]
+                parent = frame[0] if frame[1] is None else frame[1]
+                if parent is None:
+                    root = node
+                else:
+                    self.link(parent, node)
+                frame[1] = node
+            elif c == '(':
+                if frames:
+                    frame = frames[-1]
+                    if frame[1] is None:
+                        # Treat a doubled '(' as a single one.
+                        self.error(pos, pos + 1)
+                        frames.append([frame[0], None, False])
+                    else:
+                        frame[2] = True
+                        frames.append([frame[1], None, False])
+                else:
+                    frames.append([None, None, False])
+                pos += 1
+            elif c == ')':
+                if not frames or frames[-1][1] is None:
+                    self.error(pos, pos + 1)
+                if frames:
+                    frames.pop()
+                pos += 1
+                if not frames:
+                    return root, pos
+            elif c == '':
+                return root, self.error(pos, pos)
+            else:
+                pos = self.error(pos, _resync_re.match(data, pos).end())
+                continue
+            pos = match_ws(data, pos).end()
+
+    def parse_node(self, pos):
+        m, node_res = self.match_node(pos)
+        return self.build_node(m, node_res), m.end()
+
+    def match_node(self, pos, node_res=None):
+        """Match the node at pos, returning the match and the regular
+        expressions which matched it."""
+        data = self.data
+        match_ws = _whitespace_re.match
+        m = (node_res or self.node_res)[0].match(data, pos)
+        if self.recover and not node_res and \
+           not self.retry_node_res is None:
+            follow = match_ws(data, m.end()).end()
+            if not data[follow:follow + 1] in ('(', ')', ';'):
+                retry_m, retry_res = self.match_node(pos, self.retry_node_res)
+                follow = match_ws(data, retry_m.end()).end()
+                if data[follow:follow + 1] in ('(', ')', ';'):
+                    self.error(m.end(), retry_m.end())
+                    return retry_m, retry_res
+        return m, node_res or self.node_res
+
+    def build_node(self, m, node_res):
+        node_re, property_re, value_re = node_res
+        text = m.group()
+        node = Node()
+        node.text = text
+        find_values = value_re.findall
+        for prop_id, values, last_value in property_re.findall(text, 1):
+            if not node.get(prop_id) is None:
                 # Erase duplicate properties and issue a warning!
                 warnings.warn("Duplicate '%s' property in node '%s'" % 
-                              (prop[0], text))
+                              (prop_id, text))
                 continue
-            n[prop[0]] += prop[1:]
-        return n
-
-    def Property(self, (tag, start, stop, subtags), buff):
-        return simpleparse.dispatchprocessor.dispatchList(self, subtags, buff)
-
-    def PropIdent(self, (tag, start, stop, subtags), buff):
-        return simpleparse.dispatchprocessor.getString((tag, start, stop, 
-                                                        subtags), buff)
-
-    def ValueType(self, (tag, start, stop, subtags), buff):
-        return simpleparse.dispatchprocessor.getString((tag, start, stop, subtags), buff)
-
-def parse(data, forgiving_mode=False):
-    decl = _forgiving_EBNFDeclaration if forgiving_mode else _EBNFDeclaration
-    parser = simpleparse.parser.Parser(decl, "Collection")
-    processor = _SGFProcessor()
-    success, collection, next_char = parser.parse(data, processor=processor)
-    if not success:
-        if forgiving_mode:
-            raise SGFParseError("Parse Failed!")
-        else:
+            node[prop_id] = find_values(values)
+        return node
+
+    def link(self, parent, node):
+        parent.child_nodes.append(node)
+        node.parent_node = parent
+
+    def error(self, pos, resume):
+        """Record an error at pos and return the position to resume at."""
+        if not self.recover:
+            raise _ParseFailure(pos)
+        self.collection.errors.append((pos, resume))
+        return resume
+
+class _CompactParser(_Parser):
+    """Parser building a Tree for each game tree, holding spans of data 
+    rather than copies of its values."""
+    def parse_game_tree(self, pos):
+        self.tree = Tree(self.data)
+        root, pos = _Parser.parse_game_tree(self, pos)
+        return (None if root is None else NodeView(self.tree, root)), pos
+
+    def build_node(self, m, node_res):
+        node_re, property_re, value_re = node_res
+        props = []
+        seen = set()
+        for pm in property_re.finditer(self.data, m.start() + 1, m.end()):
+            prop_id = pm.group(1)
+            if prop_id in seen:
+                # Erase duplicate properties and issue a warning!
+                warnings.warn("Duplicate '%s' property in node '%s'" % 
+                              (prop_id, m.group()))
+                continue
+            seen.add(prop_id)
+            if self.data.find('[', pm.start(2)) == pm.start(3) - 1:
+                # A single value, so the last value is the only one.
+                props.append((prop_id, [pm.span(3)]))
+            else:
+                props.append((prop_id, [vm.span(1) for vm in value_re.finditer(
+                                        self.data, pm.start(2), pm.end(2))]))
+        return self.tree.add_node(m.start(), m.end(), props)
+
+    def link(self, parent, node):
+        self.tree.link(parent, node)
+
+if not simpleparse is None:
+    class _SGFProcessor(simpleparse.dispatchprocessor.DispatchProcessor):
+        def GameTree(self, (tag, start, stop, subtags), buff):
+            seqs = simpleparse.dispatchprocessor.dispatchList(self, subtags, 
+                                                              buff)
+            tail_node = seqs[0]
+            while len(tail_node.child_nodes) > 0:
+                tail_node = tail_node.child_nodes[0]
+            for tree in seqs[1:]:
+                tail_node.child_nodes.append(tree)
+                tree.parent_node = tail_node
+            return seqs[0]
+            
+        def Sequence(self, (tag, start, stop, subtags), buff):
+            nodes = simpleparse.dispatchprocessor.dispatchList(self, subtags, 
+                                                               buff)
+            for nodeA, nodeB in zip(nodes, nodes[1:]):
+                nodeA.child_nodes.append(nodeB)
+                nodeB.parent_node = nodeA
+            return nodes[0]
+        
+        def Node(self, (tag, start, stop, subtags), buff):
+            props = simpleparse.dispatchprocessor.dispatchList(self, subtags, 
+                                                               buff)
+            n = Node()
+            text = simpleparse.dispatchprocessor.getString((tag, start, stop, 
+                                                            subtags), buff)
+            n.text = text
+            for prop in props:
+                if not n.get(prop[0]) is None:
+                    # Erase duplicate properties and issue a warning!
+                    warnings.warn("Duplicate '%s' property in node '%s'" % 
+                                  (prop[0], text))
+                    continue
+                n[prop[0]] += prop[1:]
+            return n
+
+        def Property(self, (tag, start, stop, subtags), buff):
+            return simpleparse.dispatchprocessor.dispatchList(self, subtags, 
+                                                              buff)
+
+        def PropIdent(self, (tag, start, stop, subtags), buff):
+            return simpleparse.dispatchprocessor.getString((tag, start, stop, 
+                                                            subtags), buff)
+
+        def ValueType(self, (tag, start, stop, subtags), buff):
+            return simpleparse.dispatchprocessor.getString((tag, start, stop, 
+                                                            subtags), buff)
+
+def _grammar_parse(data, forgiving_mode):
+    if simpleparse is None:
+        raise SGFParseError("simpleparse is not available")
+    parser = _grammar_parsers.get(forgiving_mode)
+    if parser is None:
+        decl = _forgiving_EBNFDeclaration if forgiving_mode else \
+                                                               _EBNFDeclaration
+        parser = simpleparse.parser.Parser(decl, "Collection")
+        _grammar_parsers[forgiving_mode] = parser
+    success, collection, next_char = parser.parse(data, 
+                                                  processor=_SGFProcessor())
+    return collection if success else []
+
+def parse(data, forgiving_mode=False, use_grammar=False, compact=False):
+    """Parse sgf data into a Collection of game trees.
+
+    Malformed data is recovered from in a single pass, keeping every node
+    parsed before the error.  With compact set, each game tree is held in a 
+    Tree and its root is a NodeView.  If use_grammar is set the simpleparse 
+    grammar (if installed) is used instead, reparsing in forgiving mode on 
+    failure, and compact is ignored.
+
+    """
+    if use_grammar:
+        collection = Collection(_grammar_parse(data, forgiving_mode))
+        if collection == [] and not forgiving_mode:
             warnings.warn("Parse failed, attempting parse in forgiving mode")
-            return parse(data, forgiving_mode=True)
+            return parse(data, forgiving_mode=True, use_grammar=use_grammar)
     else:
-        return collection
+        parser_class = _CompactParser if compact else _Parser
+        collection = parser_class(data, forgiving_mode, recover=True).parse()
+        if not collection.errors == []:
+            warnings.warn("Recovered from %s parse errors at %s" % 
+                          (len(collection.errors), 
+                           ', '.join(str(x) for x, y in collection.errors)))
+    if collection == []:
+        raise SGFParseError("Parse Failed!")
+    return collection
 
-def parse_file(filename):
-    with open(filename) as f:
-        data = f.read()
-    return parse(data)
+def game_tree_offsets(buff):
+    """Return (start, stop) offsets of each game tree in a collection.
+
+    Only brackets and property values are scanned, so buff can be any string 
+    or buffer, such as an mmap of a large collection file.
+
+    """
+    offsets = []
+    depth = 0
+    start = None
+    for m in _tree_token_re.finditer(buff):
+        if m.lastindex == 1:
+            if depth == 0:
+                start = m.start()
+                if _tree_start_re.match(buff, start) is None:
+                    start = None
+            depth += 1
+        elif m.lastindex == 2 and depth > 0:
+            depth -= 1
+            if depth == 0 and not start is None:
+                offsets.append((start, m.end()))
+    return offsets
 
+def unescape(value):
+    """Decode the escapes in a text value: a backslash keeps the character
+    after it, and removes a line break after it (a soft line break)."""
+    return _escape_re.sub(lambda m: '' if m.group(1) in ('\r\n', '\n\r', 
+                                                         '\r', '\n') 
+                          else m.group(1), value)
+
+def read_file(filename):
+    """Return the contents of a file as a read only mmap, or an empty string 
+    for an empty file (which can't be mapped)."""
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def parse_file(filename):
+    return parse(read_file(filename), compact=True)
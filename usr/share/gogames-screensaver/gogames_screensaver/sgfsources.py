@@ -24,6 +24,7 @@
 import gio
 import glib
 import itertools
+import mmap
 import os
 import pickle
 import random
@@ -33,11 +34,15 @@ import sys
 import warnings
 import xml.dom.minidom
 
+import gamecache
 import gogame
+import perfstats
+import sgfparse
 
 from config import sources
 from constants import data_folder, cache_folder, save_bad_sgf_data
 gameid_cache_file = "gameid_cache"
+collection_index_file = "collection_index"
 
 try:
     with open(os.path.join(cache_folder, gameid_cache_file)) as f:
@@ -45,6 +50,15 @@ try:
 except IOError:
     gameid_cache = {}
 
+try:
+    with open(os.path.join(cache_folder, collection_index_file), 'rb') as f:
+        collection_index = pickle.load(f)
+except Exception:
+    # A missing or unreadable index just means files get indexed again.
+    collection_index = {}
+
+game_cache = gamecache.GameCache(os.path.join(cache_folder, "games"))
+
 class SGFSource(object):
     preload_count = 5
 
@@ -59,7 +73,9 @@ class SGFSource(object):
             data, uri = self.preloaded_data.pop(0)
         game_node = self.game_node_from_data(data)
         if game_node is None:
-            self.game_uris.remove(uri)
+            # The same uri can be preloaded more than once.
+            if uri in self.game_uris:
+                self.game_uris.remove(uri)
             return self.get_random_game()
         else:
             for i in range(self.preload_count - len(self.preloaded_data)):
@@ -79,17 +95,20 @@ class SGFSource(object):
         except glib.GError:
             pass
 
+    @perfstats.timed('load')
     def game_node_from_data(self, data):
         game_node = None
         try:
-            collection = gogame.game_nodes_from_data(data)
-            game_node = collection[0]
+            game_node = self.build_game_node(data)
         except gogame.GogameError, e:
             if not e.data == "":
                 if save_bad_sgf_data:
                     self.save_sgf(e.data)
         return game_node
 
+    def build_game_node(self, data):
+        return gogame.game_nodes_from_data(data, main_line_only=True)[0]
+
     @staticmethod
     def save_sgf(data):
         folder = os.path.join(cache_folder, "sgf_fail")
@@ -104,9 +123,12 @@ class SGFSource(object):
 
 class FileSource(SGFSource):
     default_sgf_folder = os.path.join(data_folder, "sgf")
+    index_save_delay = 10
+    index_save_pending = False
     
     def __init__(self, sgf_folder=None):
         self.sgf_folder = sgf_folder
+        self.bad_games = set()
         SGFSource.__init__(self)
 
     def preload_game_uris(self):
@@ -128,9 +150,108 @@ class FileSource(SGFSource):
     def preload_game(self):
         if not self.game_uris == []:
             uri = random.choice(self.game_uris)
-            gfile = gio.File(uri)
-            data = gfile.load_contents()[0]
-            self.preloaded_data.append((data, uri))
+            self.preloaded_data.append((uri, uri))
+
+    def build_game_node(self, filename):
+        """Build a random game from a (possibly multi-game) sgf file.
+
+        Game tree offsets are looked up in the collection index, and compiled
+        games are kept in the game cache, so a game which has been shown 
+        before is loaded without reading or parsing its sgf data.  A game
+        which fails to load is skipped from then on, and the file is only 
+        given up on once none of its games load.
+
+        """
+        try:
+            with open(filename, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_size == 0:
+                    raise gogame.GogameError("Empty file: %s" % filename, "")
+                buff = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    compiled = self.compiled_game(filename, stat, buff)
+                finally:
+                    buff.close()
+        except (IOError, OSError, mmap.error), e:
+            raise gogame.GogameError("Couldn't read %s - %s" % (filename, e),
+                                     "")
+        return gogame.game_node_from_compiled(compiled)
+
+    def compiled_game(self, filename, stat, buff):
+        key = (stat.st_mtime, stat.st_size)
+        entry = collection_index.get(filename)
+        if entry is None or not entry[0] == key:
+            entry = (key, sgfparse.game_tree_offsets(buff))
+            collection_index[filename] = entry
+            self.queue_collection_index_save()
+        keys = [(filename, stat.st_mtime, stat.st_size, start, stop) for 
+                start, stop in entry[1] or [(0, stat.st_size)]]
+        keys = [key for key in keys if not key in self.bad_games]
+        if keys == []:
+            raise gogame.GogameError("No games left in %s" % filename, "")
+        while True:
+            key = random.choice(keys)
+            compiled = game_cache.load(key)
+            if not compiled is None:
+                return compiled
+            try:
+                compiled = gogame.compile_game(buff[key[3]:key[4]])
+            except gogame.GogameError, e:
+                self.bad_games.add(key)
+                keys.remove(key)
+                if keys == []:
+                    raise
+                if not e.data == "" and save_bad_sgf_data:
+                    self.save_sgf(e.data)
+                continue
+            game_cache.store(key, compiled)
+            return compiled
+
+    @classmethod
+    def queue_collection_index_save(cls):
+        """Save the collection index after index_save_delay seconds, so that
+        indexing a folder of new files writes the index once, not once per
+        file."""
+        if not cls.index_save_pending:
+            cls.index_save_pending = True
+            glib.timeout_add_seconds(cls.index_save_delay, 
+                                     cls._save_collection_index_cb)
+
+    @classmethod
+    def _save_collection_index_cb(cls):
+        cls.index_save_pending = False
+        cls.save_collection_index()
+        return False
+
+    @staticmethod
+    def save_collection_index():
+        """Drop index entries for files which no longer exist, and replace 
+        the saved index with a temp file, so that instances saving at the 
+        same time can't leave a truncated index behind."""
+        for filename in collection_index.keys():
+            if not os.path.exists(filename):
+                del collection_index[filename]
+        filename = os.path.join(cache_folder, collection_index_file)
+        temp_filename = "%s.%d.tmp" % (filename, os.getpid())
+        try:
+            if not os.path.isdir(cache_folder):
+                os.makedirs(cache_folder, 0700)
+            with open(temp_filename, 'wb') as f:
+                pickle.dump(collection_index, f, pickle.HIGHEST_PROTOCOL)
+            try:
+                os.rename(temp_filename, filename)
+            except OSError:
+                # Windows won't rename over an existing file.
+                if not os.path.exists(filename):
+                    raise
+                os.remove(filename)
+                os.rename(temp_filename, filename)
+        except (IOError, OSError), e:
+            warnings.warn("Couldn't save collection index - %s" % e)
+            try:
+                os.remove(temp_filename)
+            except OSError:
+                pass
 
 class WebSource(SGFSource):
     def __init__(self, sid):
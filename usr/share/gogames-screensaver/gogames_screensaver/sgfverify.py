@@ -112,6 +112,33 @@ property_info = {
 _property_conflicts = (('B', 'W'), ('DM', 'UC', 'GB', 'GW'), 
                        ('BM', 'TE', 'DO', 'IT'))
 
+_prop_types = ('root', 'game-info', 'setup', 'move', 'move-timing', 
+               'move-annotation', 'annotation', 'markup', 'print')
+(_ROOT, _GAME_INFO, _SETUP, _MOVE, _MOVE_TIMING, _MOVE_ANNOTATION, 
+ _ANNOTATION, _MARKUP, _PRINT) = (1 << i for i in range(len(_prop_types)))
+
+def _build_prop_masks():
+    """Map each property to a bitmask used to classify nodes in one pass.
+
+    A property's mask has one bit for its property type and, for properties
+    in _property_conflicts, one bit of its own.
+
+    """
+    prop_masks = dict((prop_id, 1 << _prop_types.index(info[1])) for 
+                      prop_id, info in property_info.iteritems())
+    conflict_masks = []
+    bit = 1 << len(_prop_types)
+    for conflict_list in _property_conflicts:
+        mask = 0
+        for prop_id in conflict_list:
+            prop_masks[prop_id] |= bit
+            mask |= bit
+            bit <<= 1
+        conflict_masks.append((mask, conflict_list))
+    return prop_masks, tuple(conflict_masks)
+
+_prop_masks, _conflict_masks = _build_prop_masks()
+
 class SGFVerifyError(Exception):
     def __init__(self, value):
         self.value = value
@@ -132,91 +159,88 @@ def _verify_collection(collection):
         verify_node(node)
 
 def verify_node(node, ff=1):
+    """Verify a node and its children in a single top down pass.
+
+    The FF version and whether an ancestor held game-info properties are 
+    passed down the tree rather than looked up from each node.
+
+    """
     if node.parent_node == None:
         for prop_id in node.keys():
             if filter(lambda x: x.isupper(), prop_id) == 'FF':
                 ff = node[prop_id]
-    if ff == 4:
-        for prop_id in node.keys():
-            if not prop_id.isupper():
-                raise SGFVerifyError("Invalid prop id in a FF[4] file: %s" % 
-                                     node)
-    all_prop_types = _get_all_prop_types(node)
-    if all_prop_types.get('root') and not node.parent_node == None:
-        raise SGFVerifyError("Invalid 'root' property: %s" % node)
-    elif all_prop_types.get('game-info'):
-        working_node = node
-        while not working_node.parent_node == None:
-            working_node = working_node.parent_node
-            if _has_game_info_props(working_node):
-                raise SGFVerifyError("Invalid 'game-info' property: %s" % node)
-    elif all_prop_types.get('setup') and all_prop_types.get('move') and ff==4:
-         raise SGFVerifyError("Invalid mix of 'root' and 'setup' properties: "
-                              "%s" % node)
-    elif (all_prop_types.get('move-annotation') or 
-          all_prop_types.get('move-timing')) and not \
-         (node.get('B') or node.get('W')) and ff == 4:
-         raise SGFVerifyError("Move annotation or timing in non-move mode: %s" 
-                              % node)
-    for conflict_list in _property_conflicts:
-        if len(tuple(prop_id for prop_id in conflict_list if 
-               not node.get(prop_id) == None)) > 1:
-            raise SGFVerifyError("Property conflict in set %s: %s" % 
-                                 (conflict_list, node))
-
-    for child in node.child_nodes:
-        verify_node(child, ff)
+    stack = [(node, False)]
+    while stack:
+        node, game_info_seen = stack.pop()
+        if ff == 4:
+            for prop_id in node.keys():
+                if not prop_id.isupper():
+                    raise SGFVerifyError("Invalid prop id in a FF[4] file: "
+                                         "%s" % node)
+        mask = _prop_mask(node)
+        if mask & _ROOT and not node.parent_node == None:
+            raise SGFVerifyError("Invalid 'root' property: %s" % node)
+        elif mask & _GAME_INFO:
+            if game_info_seen:
+                raise SGFVerifyError("Invalid 'game-info' property: %s" 
+                                     % node)
+        elif mask & _SETUP and mask & _MOVE and ff == 4:
+             raise SGFVerifyError("Invalid mix of 'root' and 'setup' "
+                                  "properties: %s" % node)
+        elif mask & (_MOVE_ANNOTATION | _MOVE_TIMING) and not \
+             (node.get('B') or node.get('W')) and ff == 4:
+             raise SGFVerifyError("Move annotation or timing in non-move "
+                                  "mode: %s" % node)
+        for conflict_mask, conflict_list in _conflict_masks:
+            conflicts = mask & conflict_mask
+            if conflicts & (conflicts - 1):
+                raise SGFVerifyError("Property conflict in set %s: %s" % 
+                                     (conflict_list, node))
+        game_info_seen = game_info_seen or bool(mask & _GAME_INFO)
+        stack.extend((child, game_info_seen) for child in 
+                     reversed(node.child_nodes))
 
 def convert_node(node, ff):
     """Convert a node and its children from FF[1]-[3] to FF[4]."""
-    for prop_id in node.keys():
-        value = node[prop_id]
-        new_prop_id = filter(lambda x: x.isupper(), prop_id)
-        if not new_prop_id == prop_id:
-            node[new_prop_id] = value
-            del node[prop_id]
-        prop_id = new_prop_id
-        if prop_id == 'M' and ff in (1, 2):
-            node['MA'] = value
-            del node['M']
-        if prop_id in ('B', 'W') and value == ['tt'] and ff in (1, 2, 3):
-            node[prop_id] = ['']
-        if prop_id == 'L' and ff in (1, 2):
-            node['LB'] += ["%s:%s" % (x, l) for x, l in zip(value, 
-                           string.uppercase)]
-            del node['L']
-        if prop_id == 'VW' and len(value) == 2 and ff in (1, 2, 3):
-            node['VW'] = ["%s:%s" % value]
-    all_prop_types = _get_all_prop_types(node)
-    if all_prop_types.get('setup') and all_prop_types.get('move') and \
-                                                               ff in (1, 2, 3):
-        new_node = sgfparse.Node()
-        new_node.text = node.text
+    stack = [node]
+    while stack:
+        node = stack.pop()
         for prop_id in node.keys():
-            prop_type = property_info.get(prop_id)
-            if not prop_type == None:
-                prop_type = prop_type[1]
-            if not prop_id == 'N' or prop_type in ('game-info', 'setup', 'root'):
-                new_node[prop_id] = node[prop_id]
+            new_prop_id = filter(lambda x: x.isupper(), prop_id)
+            if new_prop_id == prop_id and not ff in (1, 2, 3):
+                # Nothing to convert, so don't read the values.
+                continue
+            value = node[prop_id]
+            if not new_prop_id == prop_id:
+                node[new_prop_id] = value
                 del node[prop_id]
-        new_node.child_nodes = node.child_nodes
-        node.child_nodes = [new_node]
-        new_node.parent = node
-    for child in node.child_nodes:
-        convert_node(child, ff)
-
-def _get_all_prop_types(node):
-    property_details = _get_property_details(node)
-    all_prop_types = {}
-    for entry in property_details:
-        all_prop_types[entry[1]] = True
-    return all_prop_types
-
-def _has_game_info_props(node):
-    property_details = _get_property_details(node)
-    return any(x[1] == 'game-info' for x in property_details)
-    
-def _get_property_details(node):
-    return tuple(property_info.get(prop_id) for prop_id in node.keys() if not \
-                                            property_info.get(prop_id) == None)
-
+            prop_id = new_prop_id
+            if prop_id == 'M' and ff in (1, 2):
+                node['MA'] = value
+                del node['M']
+            if prop_id in ('B', 'W') and value == ['tt'] and ff in (1, 2, 3):
+                node[prop_id] = ['']
+            if prop_id == 'L' and ff in (1, 2):
+                node['LB'] += ["%s:%s" % (x, l) for x, l in zip(value, 
+                               string.uppercase)]
+                del node['L']
+            if prop_id == 'VW' and len(value) == 2 and ff in (1, 2, 3):
+                node['VW'] = ["%s:%s" % value]
+        mask = _prop_mask(node)
+        if mask & _SETUP and mask & _MOVE and ff in (1, 2, 3):
+            new_node = node.split()
+            for prop_id in node.keys():
+                prop_type = property_info.get(prop_id)
+                if not prop_type == None:
+                    prop_type = prop_type[1]
+                if not (prop_id == 'N' or prop_type in ('game-info', 'setup', 
+                                                        'root')):
+                    new_node[prop_id] = node[prop_id]
+                    del node[prop_id]
+        stack.extend(reversed(node.child_nodes))
+
+def _prop_mask(node):
+    mask = 0
+    for prop_id in node:
+        mask |= _prop_masks.get(prop_id, 0)
+    return mask